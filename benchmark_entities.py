@@ -0,0 +1,63 @@
+# Benchmark of the employer entity resolution (lmia_entities.py).
+# Builds synthetic employers spelled in different ways, at a multiple of the
+# current size of the master file, and times assign_employer_ids. Runs offline.
+#
+#   python benchmark_entities.py --scale 10
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from lmia_entities import assign_employer_ids
+
+# About the number of rows of the master file today
+CURRENT_ROWS = 320000
+
+PROVINCES = ['AB', 'BC', 'MB', 'NB', 'NL', 'NS', 'ON', 'PE', 'QC', 'SK']
+WORDS = ['Maple', 'Northern', 'Prairie', 'Farms', 'Construction', 'Restaurant', 'Trucking',
+         'Greenhouses', 'Care', 'Services', 'Holdings', 'Foods', 'Tech', 'Dairy', 'Pizza']
+
+
+def build_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    employers = max(rows // 6, 1)
+    # distinct employers: numbered companies and word based names
+    numbered = rng.random(employers) < 0.4
+    names = np.where(numbered,
+                     pd.Series(rng.integers(1000000, 9999999, employers)).astype(str) + ' Ontario Inc.',
+                     pd.Series(rng.choice(WORDS, employers)) + ' ' + pd.Series(rng.choice(WORDS, employers))
+                     + ' ' + pd.Series(rng.integers(1, 999, employers)).astype(str) + ' Ltd')
+    letters = np.array(list('ABCEGHJKLMNPRSTVXY'))
+    postal = (pd.Series(rng.choice(letters, employers)) + pd.Series(rng.integers(0, 9, employers)).astype(str)
+              + pd.Series(rng.choice(letters, employers)) + ' '
+              + pd.Series(rng.integers(0, 9, employers)).astype(str) + pd.Series(rng.choice(letters, employers))
+              + pd.Series(rng.integers(0, 9, employers)).astype(str))
+    addresses = 'City, ' + pd.Series(rng.choice(PROVINCES, employers)) + ' ' + postal
+
+    # every row is one of the employers, spelled in one of a few ways
+    picks = rng.integers(0, employers, rows)
+    employer = pd.Series(names[picks])
+    variant = rng.integers(0, 4, rows)
+    employer = employer.where(variant != 1, employer.str.upper())
+    employer = employer.where(variant != 2, employer.str.replace('.', '', regex=False).str.replace(' ', '  ', n=1))
+    employer = employer.where(variant != 3, employer.str.replace(' Ltd', ' Limited', regex=False))
+    return pd.DataFrame({'Employer': employer, 'Address': addresses.to_numpy()[picks]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the employer entity resolution')
+    parser.add_argument('--scale', type=float, default=10,
+                        help='multiple of the current number of rows (' + str(CURRENT_ROWS) + ')')
+    args = parser.parse_args()
+
+    rows = int(CURRENT_ROWS * args.scale)
+    df = build_frame(rows)
+    start = time.perf_counter()
+    ids = assign_employer_ids(df)
+    elapsed = time.perf_counter() - start
+    print('Rows:       ' + str(rows))
+    print('Names:      ' + str(df['Employer'].nunique()) + ' distinct spellings')
+    print('Employers:  ' + str(ids.nunique()) + ' ids')
+    print('Time:       %.2f s (%.0f rows/s)' % (elapsed, rows / elapsed))
@@ -0,0 +1,75 @@
+# Micro-benchmark of the row filters: the chained str.contains / != masks
+# used before, against the compiled single-pass filters of lmia_filters.py.
+# Runs offline on a synthetic frame with the 2017-Q1-Q2 to 2021-Q3 layout.
+#
+#   python benchmark_filters.py --rows 1000000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from lmia_filters import COMPILED_FILTERS
+
+
+def build_frame(rows, seed=0):
+    # Synthetic raw frame: data rows, repeated column names and note lines
+    rng = np.random.default_rng(seed)
+    provinces = np.array(['Alberta', 'Ontario', 'Quebec', 'Notes:', '1. The source', '4. Effective November'])
+    streams = np.array(['High Wage', 'Low Wage', 'Program Stream', 'Stream'])
+    df = pd.DataFrame({
+        'Province_raw': provinces[rng.choice(len(provinces), rows, p=[0.33, 0.33, 0.3, 0.01, 0.02, 0.01])],
+        'Stream_raw': streams[rng.choice(len(streams), rows, p=[0.5, 0.49, 0.005, 0.005])],
+        'Employer_raw': rng.choice(['Employer', '1000 Ontario Inc.', 'Maple Farms Ltd'], rows, p=[0.01, 0.5, 0.49]),
+        'Address_raw': rng.choice(['Address', 'Brampton, ON L6S 6B5'], rows, p=[0.01, 0.99]),
+        'NOC_raw': rng.choice(['Occupation', '6322-Cooks'], rows, p=[0.01, 0.99]),
+        'Positions_raw': rng.choice(['Approved Positions', '1', '2'], rows, p=[0.01, 0.5, 0.49]),
+    })
+    return df.astype(object)
+
+
+def chained_mask(df_name):
+    # The filter as it was written before, one column scan per condition
+    return ((~df_name['Province_raw'].str.contains('Notes:', na=False))
+            & (~df_name['Province_raw'].str.contains('1. ', na=False))
+            & (~df_name['Province_raw'].str.contains('2. ', na=False))
+            & (~df_name['Province_raw'].str.contains('3. ', na=False))
+            & (~df_name['Province_raw'].str.contains('4. ', na=False))
+            & (~df_name['Province_raw'].str.contains('5. ', na=False))
+            & (~df_name['Province_raw'].str.contains('6. ', na=False))
+            & (~df_name['Province_raw'].str.contains('7. ', na=False))
+            & (df_name['Stream_raw'] != 'Stream')
+            & (df_name['Stream_raw'] != 'Program Stream')
+            & (df_name['Employer_raw'] != 'Employer')
+            & (df_name['Address_raw'] != 'Address')
+            & (df_name['NOC_raw'] != 'Occupation')
+            & (df_name['Positions_raw'] != 'Positions Approved')
+            & (df_name['Positions_raw'] != 'Approved Positions')).to_numpy()
+
+
+def best_time(function, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the row filters')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = build_frame(args.rows)
+    chained_time, chained_result = best_time(chained_mask, df, args.repeat)
+    compiled_time, compiled_result = best_time(COMPILED_FILTERS['2017_q1_to_2021_q3'], df, args.repeat)
+
+    # both filters must keep exactly the same rows
+    assert (chained_result == compiled_result).all()
+    print('Rows:           ' + str(args.rows) + ' (' + str(int(compiled_result.sum())) + ' kept)')
+    print('Chained masks:  %.3f s' % chained_time)
+    print('Compiled:       %.3f s' % compiled_time)
+    print('Speed-up:       %.1fx' % (chained_time / compiled_time))
@@ -0,0 +1,133 @@
+# Offline benchmark of the pipeline stages on synthetic files (lmia_synthetic.py).
+# For each scale (1x = about today's volume) it generates the four layouts,
+# then reports the time, the throughput and the peak memory of each stage:
+# parse, transform (per layout), concat & NOC split, address split, employer
+# ids, normalize and the csv export of the pipeline (the master file, its
+# splits and the byte-offset index, written to a temporary folder).
+# The peak memory is the peak RSS of the process so far; with --trace-memory
+# it is the peak of each stage (tracemalloc), but the stages run much slower.
+#
+#   python benchmark_pipeline.py --scales 1,10,100 --json bench.json
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from lmia_address import split_address
+from lmia_entities import assign_employer_ids
+from lmia_export import export_csv
+from lmia_normalize import normalize_master, with_noc_labels
+from lmia_report import peak_rss_mb
+from lmia_sniff import read_sniffed
+from lmia_synthetic import generate
+from lmia_transform import (MASTER_COLUMNS, process_2014_2015, process_2016, process_2017_q1_to_2021_q3,
+                            process_2021_q4_to_2024_q1, split_noc)
+
+# Layout: (processing function, number of files today, about rows per file)
+LAYOUTS = {
+    '2014_2015': (process_2014_2015, 2, 5000),
+    '2016': (process_2016, 1, 10000),
+    '2017_q1_to_2021_q3': (process_2017_q1_to_2021_q3, 18, 10000),
+    '2021_q4_to_2024_q1': (process_2021_q4_to_2024_q1, 10, 12000),
+}
+# Rows of every split of the master csv file, like in the pipeline
+ROWS_PER_FILE = 100000
+
+
+def measure(results, scale, stage, rows_in, function, *args):
+    # Run one stage, function(*args), and record its wall time and peak memory
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    if tracemalloc.is_tracing():
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+    else:
+        peak_mb = peak_rss_mb()
+    rows_out = len(result) if isinstance(result, (pd.DataFrame, pd.Series)) else None
+    results.append({'scale': scale, 'stage': stage, 'rows_in': rows_in, 'rows_out': rows_out,
+                    'seconds': round(elapsed, 4),
+                    'rows_per_second': round(rows_in / elapsed) if elapsed > 0 else None,
+                    'peak_mb': round(peak_mb, 1) if peak_mb is not None else None})
+    print('%6sx  %-32s %10d rows  %8.3f s  %12s rows/s  %8s MB' % (
+        scale, stage, rows_in, elapsed, results[-1]['rows_per_second'], results[-1]['peak_mb']))
+    return result
+
+
+def parse(content, format, layout):
+    # The raw DataFrame of a file, read like in the pipeline
+    return read_sniffed(content, format, layout)[1]
+
+
+def concat_and_split(datasets):
+    return split_noc(pd.concat(datasets))
+
+
+def export(master_df, directory):
+    # The master csv file and its splits, exported like in the pipeline
+    base_filename = os.path.join(directory, 'Employer_list_positive_LMIA_Canada')
+    return export_csv(with_noc_labels(master_df), base_filename + '.csv', base_filename, ROWS_PER_FILE,
+                      MASTER_COLUMNS)
+
+
+def run_scale(scale, results, excel=False):
+    datasets = []
+    for number, (layout, (process, files, rows_per_file)) in enumerate(LAYOUTS.items()):
+        rows = int(files * rows_per_file * scale)
+        # the raw file is built outside of the measures
+        raw = generate(layout, rows, seed=number)
+        if excel:
+            buffer = io.BytesIO()
+            raw.to_excel(buffer, index=False)
+            format, content = 'xlsx', buffer.getvalue()
+        else:
+            format, content = 'csv', raw.to_csv(index=False).encode('ISO-8859-1')
+        del raw
+        # parsed like in the pipeline: header sniffing, then the columns of the layout as text
+        df_raw = measure(results, scale, 'parse ' + format + ' ' + layout, rows, parse, content, format, layout)
+        dataset = measure(results, scale, 'transform ' + layout, len(df_raw), process, df_raw)
+        dataset['YEAR'] = '2020'
+        dataset['PERIOD'] = 'Q' + str(number + 1)
+        datasets.append(dataset)
+        del df_raw, content
+
+    rows = sum(len(dataset) for dataset in datasets)
+    master_df = measure(results, scale, 'concat & NOC split', rows, concat_and_split, datasets)
+    del datasets
+    master_df = measure(results, scale, 'address split', rows, split_address, master_df)
+    ids = measure(results, scale, 'employer ids', rows, assign_employer_ids, master_df)
+    master_df['Employer_id'] = ids.to_numpy()
+    master_df = measure(results, scale, 'normalize', rows, normalize_master, master_df)
+    with tempfile.TemporaryDirectory(prefix='lmia_benchmark_') as directory:
+        measure(results, scale, 'export csv', rows, export, master_df, directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic data')
+    parser.add_argument('--scales', default='1,10',
+                        help='comma separated multiples of the current volume, e.g. 1,10,100')
+    parser.add_argument('--excel', action='store_true', help='parse xlsx files instead of csv files')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure the peak memory of each stage with tracemalloc (slower)')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    if args.trace_memory:
+        tracemalloc.start()
+    for scale in args.scales.split(','):
+        run_scale(float(scale), results, excel=args.excel)
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print('Results written to ' + args.json)
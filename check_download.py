@@ -0,0 +1,132 @@
+# Check of the concurrent downloader (lmia_download.py) against a local HTTP
+# server (http.server) serving synthetic files (lmia_synthetic.py):
+#   - first run: every file is downloaded (200) and stored in the cache
+#   - second run: every file is revalidated and not modified (304)
+#   - --offline: every file comes from the cache, without any request
+#   - a revised file is downloaded again and its old blob is removed from the cache
+#   - a 304 without a cached copy raises an error
+# Exits with an error when a case fails.
+#
+#   python check_download.py --files 8
+
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from check_engine_parity import raw_file
+from lmia_cache import RawCache
+from lmia_download import build_session, download_resources, fetch_resource
+from lmia_synthetic import generate
+
+# Path answered with 304 Not Modified on every request
+NOT_MODIFIED_PATH = '/not_modified.csv'
+
+
+class Handler(SimpleHTTPRequestHandler):
+    # The files of the directory, and the requests counted by path
+
+    requests = {}
+
+    def do_GET(self):
+        Handler.requests[self.path] = Handler.requests.get(self.path, 0) + 1
+        if self.path == NOT_MODIFIED_PATH:
+            self.send_response(304)
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def statuses(stats):
+    return sorted({entry['status'] for entry in stats.values()})
+
+
+def download(urls, files, cache, offline=False):
+    # (contents, stats) of a download of every file
+    stats = {}
+    names = sorted(urls)
+    contents = download_resources(names, ['csv'] * len(names), [urls[name] for name in names],
+                                  session=build_session(), cache=cache, offline=offline, stats=stats)
+    wrong = [name for name in names if contents[name] != ('csv', files[name])]
+    return wrong, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the downloader against a local HTTP server')
+    parser.add_argument('--files', type=int, default=8, help='number of files served')
+    parser.add_argument('--rows', type=int, default=2000, help='rows of every synthetic file')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='lmia_download_')
+    served = os.path.join(root, 'served')
+    os.makedirs(served)
+    files = {}
+    for number in range(args.files):
+        name = 'tfwp_2020q' + str(number % 4 + 1) + '_positive_en_' + str(number)
+        files[name] = raw_file(generate('2017_q1_to_2021_q3', args.rows, seed=number), 'csv')
+        with open(os.path.join(served, name + '.csv'), 'wb') as f:
+            f.write(files[name])
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=served))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+    urls = {name: base + name + '.csv' for name in files}
+    cache = RawCache(os.path.join(root, 'cache'))
+
+    failures = []
+    try:
+        for case, offline, expected in [('first run', False, ['downloaded']),
+                                        ('second run', False, ['not modified']),
+                                        ('offline run', True, ['offline'])]:
+            before = sum(Handler.requests.values())
+            wrong, stats = download(urls, files, cache, offline=offline)
+            requested = sum(Handler.requests.values()) - before
+            if wrong:
+                failures.append(case + ': wrong content of ' + ', '.join(wrong))
+            if statuses(stats) != expected:
+                failures.append(case + ': status ' + str(statuses(stats)) + ' instead of ' + str(expected))
+            if requested != (0 if offline else len(files)):
+                failures.append(case + ': ' + str(requested) + ' requests')
+            print(case + ': ' + str(len(files)) + ' files, ' + str(requested) + ' requests, status '
+                  + ', '.join(statuses(stats)))
+
+        # a new revision of a file: only its new content is kept in the cache
+        revised = sorted(files)[0]
+        files[revised] = raw_file(generate('2017_q1_to_2021_q3', args.rows, seed=args.files), 'csv')
+        path = os.path.join(served, revised + '.csv')
+        with open(path, 'wb') as f:
+            f.write(files[revised])
+        # a later modification time than the one of the cached copy
+        modified = os.path.getmtime(path) + 10
+        os.utime(path, (modified, modified))
+        wrong, stats = download(urls, files, cache)
+        blobs = len(os.listdir(cache.blob_dir))
+        if wrong or stats[revised]['status'] != 'downloaded':
+            failures.append('revised file: status ' + stats[revised]['status'])
+        if blobs != len(files):
+            failures.append('revised file: ' + str(blobs) + ' blobs in the cache for ' + str(len(files)) + ' files')
+        print('revised file: status ' + stats[revised]['status'] + ', ' + str(blobs) + ' blobs in the cache')
+
+        try:
+            fetch_resource(build_session(), base + NOT_MODIFIED_PATH[1:], cache=None)
+            failures.append('a 304 without a cached copy returned a content')
+        except requests.HTTPError:
+            print('a 304 without a cached copy raises an error')
+    finally:
+        server.shutdown()
+        shutil.rmtree(root)
+
+    if failures:
+        for failure in failures:
+            print('Failed: ' + failure)
+        sys.exit(1)
+    print('The downloader gives the same files in the 4 runs')
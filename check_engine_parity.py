@@ -0,0 +1,71 @@
+# Parity check of the engines (lmia_engine.py) on synthetic files (lmia_synthetic.py).
+# Every layout is generated as a csv and an xlsx file, processed by the pandas
+# and the DuckDB engine, and the csv exports of the two results are compared
+# byte by byte. Exits with an error when they differ.
+#
+#   python check_engine_parity.py --rows 20000
+
+import argparse
+import io
+import sys
+
+import pandas as pd
+
+from lmia_engine import PandasEngine, get_engine
+from lmia_synthetic import generate
+
+
+def raw_file(frame, format):
+    # The bytes of a synthetic frame, as published
+    if format == 'csv':
+        return frame.to_csv(index=False).encode('ISO-8859-1')
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def export(engine, resources):
+    # The csv text of the master rows built by an engine
+    datasets = []
+    # the layout is left to the sniffer (see lmia_sniff.py)
+    raws = engine.read([(format, content, None) for (_, format, content) in resources])
+    for (expected_layout, format, _), (layout, raw) in zip(resources, raws):
+        if layout != expected_layout:
+            print('The ' + engine.name + ' engine read the ' + format + ' file of the layout ' + expected_layout
+                  + ' as ' + str(layout))
+            sys.exit(1)
+        dataset = engine.process(raw, layout)
+        dataset['YEAR'] = '2020'
+        dataset['PERIOD'] = layout
+        datasets.append(dataset)
+    return engine.split_noc(pd.concat(datasets)).to_csv()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the engines give byte-identical results')
+    parser.add_argument('--engine', default='duckdb', help='engine compared with the pandas engine')
+    parser.add_argument('--rows', type=int, default=5000, help='rows of every synthetic file')
+    parser.add_argument('--formats', default='csv,xlsx')
+    args = parser.parse_args()
+
+    resources = []
+    for number, layout in enumerate(['2014_2015', '2016', '2017_q1_to_2021_q3', '2021_q4_to_2024_q1']):
+        frame = generate(layout, args.rows, seed=number)
+        for format in args.formats.split(','):
+            resources.append((layout, format, raw_file(frame, format)))
+
+    expected = export(PandasEngine(parse_workers=1), resources)
+    result = export(get_engine(args.engine), resources)
+    if result != expected:
+        for number, (line, expected_line) in enumerate(zip(result.splitlines(), expected.splitlines())):
+            if line != expected_line:
+                print('First difference on line ' + str(number + 1) + ':')
+                print('  pandas: ' + expected_line)
+                print('  ' + args.engine + ': ' + line)
+                break
+        else:
+            print('Different number of lines: ' + str(len(expected.splitlines())) + ' (pandas) and '
+                  + str(len(result.splitlines())) + ' (' + args.engine + ')')
+        sys.exit(1)
+    print('The ' + args.engine + ' engine gives the same ' + str(len(expected.splitlines()) - 1)
+          + ' rows as the pandas engine (' + str(len(expected)) + ' characters)')
@@ -0,0 +1,44 @@
+# Check of the employer entity resolution (lmia_entities.py).
+# The spellings of the same employer get one Employer_id, and the numbered
+# companies registered at the same address (e.g. at their accountant's) keep
+# one Employer_id each, however close their numbers. Exits with an error
+# otherwise.
+#
+#   python check_entities.py
+
+import sys
+
+import pandas as pd
+
+from lmia_entities import assign_employer_ids
+
+ADDRESS = 'Toronto, ON M5H 2N2'
+# (employer, address, group): the rows of a group are the same employer
+ROWS = [('2775666 Ontario Inc.', ADDRESS, 'first'),
+        ('2775666  ONTARIO INC', ADDRESS, 'first'),
+        ('2775667 Ontario Inc.', ADDRESS, 'second'),
+        ('2775667 Ontario Limited', ADDRESS, 'second'),
+        ('1000234 B.C. Ltd.', ADDRESS, 'third'),
+        ('1000243 B.C. Ltd.', ADDRESS, 'fourth'),
+        ('Maple Leaf Farms Ltd', ADDRESS, 'fifth'),
+        ('Maple Leaf Farm Ltd', ADDRESS, 'fifth')]
+
+
+if __name__ == '__main__':
+    df = pd.DataFrame(ROWS, columns=['Employer', 'Address', 'Group'])
+    df['Employer_id'] = assign_employer_ids(df)
+    ids = df.groupby('Group', sort=False)['Employer_id'].unique()
+    failed = False
+    for group, group_ids in ids.items():
+        if len(group_ids) != 1:
+            print('The spellings of the ' + group + ' employer got ' + str(len(group_ids)) + ' Employer_id: '
+                  + ', '.join(df.loc[df['Group'] == group, 'Employer']))
+            failed = True
+    for employer_id, groups in df.groupby('Employer_id')['Group'].unique().items():
+        if len(groups) != 1:
+            print('Different employers got the same Employer_id ' + employer_id + ': '
+                  + ', '.join(df.loc[df['Employer_id'] == employer_id, 'Employer']))
+            failed = True
+    if failed:
+        sys.exit(1)
+    print('The ' + str(len(df)) + ' rows got ' + str(len(ids)) + ' Employer_id, one for each employer')
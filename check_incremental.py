@@ -0,0 +1,222 @@
+# Check that an incremental run gives the same files as a full rebuild.
+# A few synthetic resources (lmia_synthetic.py) are served from an offline
+# cache with a package_show catalog. After a first run, one resource of a
+# later quarter changes and adds a record that merges two employers of older
+# quarters, so the Employer_id of old rows changes. The same state is then
+# updated by an incremental run and by a full rebuild, and every output file
+# (the csv files, the aggregates and the Parquet partitions) is compared.
+# A resource missing from the catalog keeps its rows: after a first run, a
+# run with --stream without the first resource in the catalog (and a changed
+# later resource), then a run with it again, still have its period.
+# Exits with an error when they differ.
+#
+#   python check_incremental.py --rows 2000
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+from check_engine_parity import raw_file
+from lmia_cache import RawCache
+from lmia_catalog import FIXTURE
+from lmia_synthetic import generate
+
+import data_scraper_LMIA_employer_list
+
+# (resource, layout) of the synthetic files, the last one changes after the first run
+SOURCES = [('2018q1_positive_employer_en', '2017_q1_to_2021_q3'),
+           ('2018q2_positive_employer_en', '2017_q1_to_2021_q3'),
+           ('tfwp_2022q1_positive_en', '2021_q4_to_2024_q1')]
+# Two employers with close names at different postal codes: separate groups at first
+FIRST_EMPLOYER = ('Prairie Grain Co', 'Calgary, AB T2P 1J9')
+SECOND_EMPLOYER = ('Prairie Grains', 'Calgary, AB T3X 2K1')
+# then a row with the second name at the first postal code merges them
+BRIDGE = ('Prairie Grains', 'Calgary, AB T2P 1J9')
+# files of a run that are not outputs
+SKIPPED = {'run_report.json'}
+
+
+def with_employer(frame, employer):
+    # The frame with a first data row of an employer of Alberta
+    row = dict.fromkeys(frame.columns)
+    row.update({frame.columns[0]: 'Alberta', 'Program Stream': 'High Wage', 'Employer': employer[0],
+                'Address': employer[1], 'Occupation': '6322-Cooks', 'Approved Positions': 7})
+    if 'Approved LMIAs' in frame.columns:
+        row.update({'Incorporate Status': 'Yes', 'Approved LMIAs': 1})
+    return pd.concat([pd.DataFrame([row], columns=frame.columns), frame], ignore_index=True)
+
+
+def store(cache, urls, name, frame):
+    cache.store(urls[name], raw_file(frame, urls[name].rsplit('.', 1)[-1]))
+
+
+def run(directory, *options):
+    # One run of the pipeline in a directory, offline
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        data_scraper_LMIA_employer_list.main(['--offline', '--catalog-file', 'package_show.json',
+                                              '--report', 'run_report.json'] + list(options))
+    finally:
+        os.chdir(cwd)
+
+
+def output_files(directory):
+    # {relative path: absolute path} of the output files of a run
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory)
+            if relative not in SKIPPED and relative != 'package_show.json':
+                files[relative] = path
+    return files
+
+
+def same_file(path, other):
+    # Parquet files are compared by their rows, the other files byte by byte
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path).equals(pd.read_parquet(other))
+    with open(path, 'rb') as f, open(other, 'rb') as g:
+        return f.read() == g.read()
+
+
+def old_employer_ids(directory):
+    # Employer_id of the rows of the quarters that do not change (2018)
+    master = pd.read_csv(os.path.join(directory, data_scraper_LMIA_employer_list.master_df_name), index_col=0,
+                         dtype=str, keep_default_na=False)
+    return master.loc[master['YEAR'] == '2018', 'Employer_id'].reset_index(drop=True)
+
+
+def check(root, catalog, urls, rows, first_options, options):
+    # (old rows with a new Employer_id, output files, differing files) of an incremental
+    # run after a first run with first_options, compared with a full rebuild. Both runs
+    # after the first one get options
+    names = [name for (name, _) in SOURCES]
+    incremental = os.path.join(root, 'incremental')
+    rebuild = os.path.join(root, 'rebuild')
+    os.makedirs(incremental)
+    with open(os.path.join(incremental, 'package_show.json'), 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+
+    # first run: every resource, the two employers in the two quarters of 2018
+    cache = RawCache(os.path.join(incremental, '.cache', 'lmia_raw'))
+    frames = {name: generate(layout, rows, seed=number) for number, (name, layout) in enumerate(SOURCES)}
+    store(cache, urls, names[0], with_employer(frames[names[0]], FIRST_EMPLOYER))
+    store(cache, urls, names[1], with_employer(frames[names[1]], SECOND_EMPLOYER))
+    store(cache, urls, names[2], frames[names[2]])
+    run(incremental, *first_options)
+    first_ids = old_employer_ids(incremental)
+
+    # the last quarter changes, then the same state is updated in two ways
+    shutil.copytree(incremental, rebuild)
+    for directory in [incremental, rebuild]:
+        store(RawCache(os.path.join(directory, '.cache', 'lmia_raw')), urls, names[2],
+              with_employer(frames[names[2]], BRIDGE))
+    run(incremental, *options)
+    run(rebuild, '--full-rebuild', *options)
+
+    changed_ids = int((old_employer_ids(incremental) != first_ids).sum())
+    files = output_files(incremental)
+    expected = output_files(rebuild)
+    different = sorted(name for name in set(files) | set(expected)
+                       if name not in files or name not in expected or not same_file(files[name], expected[name]))
+    return changed_ids, files, different
+
+
+def period_rows(directory, key):
+    # The rows of a (YEAR, PERIOD) of the master file, without their Employer_id
+    master = pd.read_csv(os.path.join(directory, data_scraper_LMIA_employer_list.master_df_name), index_col=0,
+                         dtype=str, keep_default_na=False)
+    rows = master[(master['YEAR'] == key[0]) & (master['PERIOD'] == key[1])]
+    return rows.drop(columns=['Employer_id']).reset_index(drop=True)
+
+
+def check_missing(root, catalog, urls, rows):
+    # (rows of the missing resource after the --stream run, after the next run, before) when the
+    # first resource is left out of the catalog of a --stream run
+    names = [name for (name, _) in SOURCES]
+    directory = os.path.join(root, 'missing')
+    os.makedirs(directory)
+    catalog_path = os.path.join(directory, 'package_show.json')
+    with open(catalog_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+    cache = RawCache(os.path.join(directory, '.cache', 'lmia_raw'))
+    frames = {name: generate(layout, rows, seed=number) for number, (name, layout) in enumerate(SOURCES)}
+    for name in names:
+        store(cache, urls, name, frames[name])
+    run(directory)
+    key = ('2018', 'Q1')
+    expected = period_rows(directory, key)
+
+    # the first resource is missing from the catalog and the last one changes
+    missing = dict(catalog, result=dict(catalog['result'], resources=[
+        resource for resource in catalog['result']['resources'] if resource['url'] != urls[names[0]]]))
+    with open(catalog_path, 'w', encoding='utf-8') as f:
+        json.dump(missing, f)
+    store(cache, urls, names[2], with_employer(frames[names[2]], BRIDGE))
+    run(directory, '--stream')
+    streamed = period_rows(directory, key)
+
+    # the resource is back in the catalog, unchanged
+    with open(catalog_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+    run(directory)
+    return streamed, period_rows(directory, key), expected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that an incremental run gives the same files as a full rebuild')
+    parser.add_argument('--rows', type=int, default=2000, help='rows of every synthetic file')
+    parser.add_argument('--keep', action='store_true', help='keep the directories of the runs')
+    args = parser.parse_args()
+
+    with open(FIXTURE, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+    names = [name for (name, _) in SOURCES]
+    catalog['result']['resources'] = [resource for resource in catalog['result']['resources']
+                                      if resource['url'].rsplit('/', 1)[-1].split('.')[0] in names]
+    urls = {resource['url'].rsplit('/', 1)[-1].split('.')[0]: resource['url']
+            for resource in catalog['result']['resources']}
+
+    # the first run in memory, in --stream mode (its master file has no Employer_id),
+    # and every run with the out-of-core duckdb engine
+    failed = False
+    for mode, first_options, options in [('in memory', [], []), ('with --stream', ['--stream'], []),
+                                         ('with --engine duckdb', ['--engine', 'duckdb'], ['--engine', 'duckdb'])]:
+        root = tempfile.mkdtemp(prefix='lmia_check_')
+        changed_ids, files, different = check(root, catalog, urls, args.rows, first_options, options)
+        if not args.keep:
+            shutil.rmtree(root)
+        if changed_ids == 0:
+            print('After a first run ' + mode + ', the changed resource did not change any Employer_id')
+            failed = True
+        elif different:
+            print('After a first run ' + mode + ', the incremental run and the full rebuild differ on '
+                  + str(len(different)) + ' files:')
+            for name in different:
+                print('  ' + name)
+            failed = True
+        else:
+            print('After a first run ' + mode + ', the incremental run gives the same ' + str(len(files))
+                  + ' files as a full rebuild (' + str(changed_ids) + ' old rows with a new Employer_id)')
+
+    root = tempfile.mkdtemp(prefix='lmia_check_')
+    streamed, restored, expected = check_missing(root, catalog, urls, args.rows)
+    if not args.keep:
+        shutil.rmtree(root)
+    if not (streamed.equals(expected) and restored.equals(expected)):
+        print('A resource missing from the catalog of a --stream run lost its rows: ' + str(len(expected))
+              + ' rows before, ' + str(len(streamed)) + ' after the --stream run, ' + str(len(restored))
+              + ' after the next run')
+        failed = True
+    else:
+        print('A resource missing from the catalog of a --stream run keeps its ' + str(len(expected)) + ' rows')
+    if failed:
+        sys.exit(1)
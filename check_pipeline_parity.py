@@ -0,0 +1,79 @@
+# Check that a whole run with the DuckDB engine gives the same files as a run
+# with the pandas engine. Synthetic resources of the four layouts
+# (lmia_synthetic.py), as csv and xlsx files, are served from an offline cache
+# with a package_show catalog and the same state is run once per engine. Every
+# output file (the csv files, the aggregates, the Parquet partitions and the
+# SQLite database) is compared. Exits with an error when they differ.
+#
+#   python check_pipeline_parity.py --rows 2000
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from check_incremental import output_files, run, same_file, store
+from lmia_cache import RawCache
+from lmia_catalog import FIXTURE
+from lmia_synthetic import generate
+
+# (resource, layout) of the synthetic files, one or more per layout
+SOURCES = [('positive_employers_en', '2014_2015'),
+           ('2016_positive_employer_en', '2016'),
+           ('2018q1_positive_employer_en', '2017_q1_to_2021_q3'),
+           ('tfwp_2022q1_positive_en', '2021_q4_to_2024_q1'),
+           ('tfwp_2022q4_pos_en', '2021_q4_to_2024_q1')]
+
+
+def with_thousands(frame):
+    # The frame with a count written with a thousands separator, as in some source files
+    frame = frame.copy()
+    column = frame.columns[-1]
+    frame[column] = frame[column].astype(object)
+    counts = frame[column].astype(str).str.fullmatch(r'\d+')
+    frame.loc[counts[counts].index[0], column] = '1,200'
+    return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that both engines give the same files on a whole run')
+    parser.add_argument('--engine', default='duckdb', help='engine compared with the pandas engine')
+    parser.add_argument('--rows', type=int, default=2000, help='rows of every synthetic file')
+    parser.add_argument('--keep', action='store_true', help='keep the directories of the runs')
+    args = parser.parse_args()
+
+    with open(FIXTURE, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+    names = [name for (name, _) in SOURCES]
+    catalog['result']['resources'] = [resource for resource in catalog['result']['resources']
+                                      if resource['url'].rsplit('/', 1)[-1].split('.')[0] in names]
+    urls = {resource['url'].rsplit('/', 1)[-1].split('.')[0]: resource['url']
+            for resource in catalog['result']['resources']}
+
+    root = tempfile.mkdtemp(prefix='lmia_check_')
+    expected_directory = os.path.join(root, 'pandas')
+    directory = os.path.join(root, args.engine)
+    os.makedirs(expected_directory)
+    with open(os.path.join(expected_directory, 'package_show.json'), 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+    cache = RawCache(os.path.join(expected_directory, '.cache', 'lmia_raw'))
+    for number, (name, layout) in enumerate(SOURCES):
+        store(cache, urls, name, with_thousands(generate(layout, args.rows, seed=number)))
+    shutil.copytree(expected_directory, directory)
+
+    run(expected_directory, '--engine', 'pandas', '--sqlite')
+    run(directory, '--engine', args.engine, '--sqlite')
+    files = output_files(directory)
+    expected = output_files(expected_directory)
+    different = sorted(name for name in set(files) | set(expected)
+                       if name not in files or name not in expected or not same_file(files[name], expected[name]))
+    if not args.keep:
+        shutil.rmtree(root)
+    if different:
+        print('The ' + args.engine + ' engine and the pandas engine differ on ' + str(len(different)) + ' files:')
+        for name in different:
+            print('  ' + name)
+        sys.exit(1)
+    print('The ' + args.engine + ' engine gives the same ' + str(len(files)) + ' files as the pandas engine')
@@ -1,364 +1,419 @@
 # import libraries
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import argparse
+import os
 import numpy as np
+import pandas as pd
 
-# read HTML URL from Wikipedia
-
-URL = "https://open.canada.ca/data/en/dataset/90fed587-1364-4f33-a9ee-208181dc0b97"
-page = requests.get(URL)
-soup = BeautifulSoup(page.content, "html.parser")
-
-# write the page to a file for a better understanding
-# This is relevant only for dev work
-# with open('page.html', 'w', encoding='utf-8') as f:
-#     f.write(page.text)
-
-# read URL's from HTML
-url_list = soup.find_all("span", {"property":"url"})
-print("There are ", len(url_list), " links with data")
-
-# read the language of the datasets
-lang_list = soup.find_all("span", {"property":"inLanguage"})
-print("There are ", len(lang_list), " languages")
-
-# remove 1st element from language list as it does not correspond to a dataset
-lang_list.pop(0)
-print("Now, there are ", len(lang_list), " languages")
-
-# onvert the language list to a string list. Otherwise we end up with NULLs
-lang_list_str = [str(elem) for elem in lang_list]
-
-# create a dataframe based on the arrays above
-df_links = pd.DataFrame({'data_link_raw':url_list, 'data_language_raw':lang_list_str})
-df_links.head()
-
-# convert dataframe columns from object type to string
-df_links['data_link_raw'] = df_links['data_link_raw'].astype('string')
-df_links['data_language_raw'] = df_links['data_language_raw'].astype('string') 
-
-# replace al the unnecessary html tags in the column values
-df_links['data_link'] = df_links['data_link_raw'].str.replace('<span property="url">', '').str.replace('</span>','')
-df_links['data_language'] = df_links['data_language_raw'].str.replace('" property="inLanguage"> </span>', '').str.replace('<span content="','')
-df_links.head()
-
-# add file_name and file_format in separate columns
-df_links['file_name'] = df_links['data_link'].str.split('/').str[-1].str.split('.').str[0]
-df_links['file_format'] = df_links['data_link'].str.split('.').str[-1]
-df_links.head(n=20)
-
-# check a the number of files (links) by language
-df_links.groupby(['data_language']).count()
-
-# create separate datasets for each language.
-df_links_en = df_links[df_links['data_language'] == 'en'][['data_link', 'data_language','file_name','file_format']]
-df_links_en.head()
-
-df_links_fr = df_links[df_links['data_language'] == 'fr'][['data_link', 'data_language','file_name','file_format']]
-df_links_fr.head()
-
-# we'll focus on English first. Scrape and download English files
-links_en_list = df_links_en['data_link'].tolist()
-file_name_en_list = df_links_en['file_name'].tolist()
-file_format_en_list = df_links_en['file_format'].tolist()
-
-# create a discionary of DataFrames by reading the files from the links, based on the file format
-# encoding of the files are described here: https://open.canada.ca/en/working-data-api/structured-data
-all_dataframes = {}
-
-for (name, format, link) in zip(file_name_en_list, file_format_en_list, links_en_list):
-    if format == 'csv':
-        print('-----Getting the ' + format + ' file ' + name + '.' + format)
-        all_dataframes[name] = pd.read_csv(link, encoding = 'ISO–8859–1')
-        print(u'\u2713' + ' Successfully extracted ' + name + '.' + format + '\n')
-    elif format == 'xls' or format == 'xlsx':
-        print('-----Getting the ' + format + ' file ' + name + '.' + format)
-        all_dataframes[name] = pd.read_excel(link)
-        print(u'\u2713' + ' Successfully extracted ' + name + '.' + format + '\n')
-
-# print the dictionary keys
-for key in all_dataframes.keys():
-    print(key)
-
-###############################################################################
-# Files don't have consistent names and values and 
-# will be processed in different batches.
-###############################################################################
-# Period 1: June 20 - December 31 2014 & Full 2015
-# Build a function that will process the dataset.
-
-def process_2014_2015(df_from_dict):
-    # Extract the dataframe from the dictionary of DataFrames
-    df_name = pd.DataFrame.from_dict(all_dataframes[df_from_dict])
-    # Add proper raw names for the columns
-    df_name.columns = ['Employer_raw', 'Address_raw', 'Positions_raw']
-    # The csv file is nested. i.e. ha the province listed on top and the data below.
-    # Move the province from the top to each corresponding rows
-    df_name['Province'] = np.where(df_name['Address_raw'].isnull(), df_name['Employer_raw'], np.nan)
-    # Fill the Province when it's empty
-    df_name['Province'] = df_name['Province'].ffill()
-    # filter out unneccessary rows [such as Notes & repeated columns names]
-    df_name = df_name[((df_name['Address_raw'].notnull())
-                                    & (df_name['Positions_raw'].notnull())
-                                    & (df_name['Employer_raw'] != 'Employer')
-                                    & (df_name['Address_raw'] != 'Address')
-                                    & (df_name['Positions_raw'] != 'Positions'))
-                                    | (df_name['Employer_raw'] == 'Other employers')
-                                    ]
-    # rename the column properly at the end by removing the 'raw' part
-    df_name = df_name.rename(columns={"Employer_raw": "Employer", 
-                                        "Address_raw": "Address",
-                                        "Positions_raw": "Positions"})
-    # add a few missing columns for future
-    df_name['NOC'] = np.nan
-    df_name['Stream'] = np.nan
-    df_name['Incorporate_status'] = np.nan
-    df_name['LMIAs'] = np.nan
-    return(df_name)
-
-employers_2014 = process_2014_2015('positive_employers_en')
-employers_2015 = process_2014_2015('2015_positive_employers_en')
-
-
-###############################################################################
-# Period 2: 1 Jan - 31 Dec 2016
-# Build a function that will process the dataset.
-
-def process_2016(df_from_dict):
-    # Extract the dataframe from the dictionary of DataFrames
-    df_name = pd.DataFrame.from_dict(all_dataframes[df_from_dict])
-    # Add proper raw names for the columns
-    df_name.columns = ['Province_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Positions_raw']
-    # Fill the Province when it's empty
-    df_name['Province_raw'] = df_name['Province_raw'].ffill()
-    # filter out unneccessary rows [such as Notes & repeated columns names]
-    df_name = df_name[((~df_name['Province_raw'].str.contains('Notes:', na=False))
-                                    & (~df_name['Province_raw'].str.contains('1. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('2. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('3. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('4. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('5. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('6. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('7. ', na=False))
-                                    & (df_name['Employer_raw'] != 'Employer')
-                                    & (df_name['Address_raw'] != 'Address')
-                                    & (df_name['NOC_raw'] != 'Occupation')
-                                    & (df_name['Positions_raw'] != 'Positions Approved')
-                                    )]
-    # rename the column properly at the end by removing the 'raw' part
-    df_name = df_name.rename(columns={"Province_raw": "Province",
-                                        "Employer_raw": "Employer", 
-                                        "Address_raw": "Address",
-                                        "NOC_raw":"NOC",
-                                        "Positions_raw": "Positions"})
-    # add a few missing columns for future
-    df_name['Stream'] = np.nan
-    df_name['Incorporate_status'] = np.nan
-    df_name['LMIAs'] = np.nan
-    return(df_name)
-
-employers_2016 = process_2016('2016_positive_employer_en')
-
-
-###############################################################################
-# Period 3: 2017-Q1-Q2 to 2021-Q3
-# Build a function that will process the dataset.
-
-def process_2017_q1_to_2021_q3(df_from_dict):
-    # Extract the dataframe from the dictionary of DataFrames
-    df_name = pd.DataFrame.from_dict(all_dataframes[df_from_dict])
-    # Add proper raw names for the columns
-    df_name.columns = ['Province_raw', 'Stream_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Positions_raw']
-    # Fill the Province & Stream when it's empty
-    df_name['Stream_raw'] = df_name['Stream_raw'].ffill()
-    df_name['Province_raw'] = df_name['Province_raw'].ffill()
-    # filter out unneccessary rows [such as Notes & repeated columns names]
-    df_name = df_name[((~df_name['Province_raw'].str.contains('Notes:', na=False))
-                                    & (~df_name['Province_raw'].str.contains('1. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('2. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('3. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('4. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('5. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('6. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('7. ', na=False))
-                                    & (df_name['Stream_raw'] != 'Stream') 
-                                    & (df_name['Stream_raw'] != 'Program Stream')
-                                    & (df_name['Employer_raw'] != 'Employer')
-                                    & (df_name['Address_raw'] != 'Address')
-                                    & (df_name['NOC_raw'] != 'Occupation')
-                                    & (df_name['Positions_raw'] != 'Positions Approved') 
-                                    & (df_name['Positions_raw'] != 'Approved Positions')
-                                    )]
-    # rename the column properly at the end by removing the 'raw' part
-    df_name = df_name.rename(columns={"Province_raw": "Province",
-                                                "Stream_raw":"Stream",
-                                                "Employer_raw": "Employer", 
-                                                "Address_raw": "Address",
-                                                "NOC_raw":"NOC",
-                                                "Positions_raw": "Positions"})
-    # add a few missing columns for future
-    df_name['Incorporate_status'] = np.nan
-    df_name['LMIAs'] = np.nan
-    return(df_name)
-
-# Process the datasets by running the above function
-
-employers_2017_q1_q2 = process_2017_q1_to_2021_q3('2017q1q2_positive_en')
-employers_2017_q3 = process_2017_q1_to_2021_q3('2017q3_positive_employer_stream_en')
-employers_2018_q1 = process_2017_q1_to_2021_q3('2018q1_positive_employer_en')
-employers_2018_q2 = process_2017_q1_to_2021_q3('2018q2_positive_employer_en')
-employers_2017_q4 = process_2017_q1_to_2021_q3('2017q4_positive_employer_en')
-employers_2018_q3 = process_2017_q1_to_2021_q3('2018q3_positive_en')
-employers_2018_q4 = process_2017_q1_to_2021_q3('2018q4_positive_en')
-employers_2019_q1 = process_2017_q1_to_2021_q3('tfwp_2019q1_employer_positive_en')
-employers_2019_q2 = process_2017_q1_to_2021_q3('tfwp_2019q2_employer_positive_en')
-employers_2019_q3 = process_2017_q1_to_2021_q3('tfwp_2019q3_positive_en')
-employers_2019_q4 = process_2017_q1_to_2021_q3('tfwp_2019q4_positive_en')
-employers_2020_q1 = process_2017_q1_to_2021_q3('tfwp_2020q1_positive_en')
-employers_2020_q2 = process_2017_q1_to_2021_q3('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2020-employer-list2020q22020q2csv202')
-employers_2020_q3 = process_2017_q1_to_2021_q3('tfwp_2020q3_positive_en')
-employers_2020_q4 = process_2017_q1_to_2021_q3('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2020-employer-list2020q4tfwp_2020q4')
-employers_2021_q1 = process_2017_q1_to_2021_q3('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2021-employer-listq1-2021tfwp_2021q')
-employers_2021_q2 = process_2017_q1_to_2021_q3('TFWP_2021Q2_Positive_EN')
-employers_2021_q3 = process_2017_q1_to_2021_q3('TFWP_2021Q3_Positive_EN')
-
+from lmia_address import parse_addresses, split_address
+from lmia_cache import DEFAULT_CACHE_DIR, RawCache
+from lmia_catalog import CATALOGS, RESOURCES, english_links, read_catalog, route_resources
+from lmia_download import (DEFAULT_MAX_WORKERS, DEFAULT_PARSE_WORKERS, build_session, download_resources,
+                           fetch_resource, iter_resource_chunks)
+from lmia_engine import ENGINES, LAYOUTS, PROCESSORS, get_engine
+from lmia_entities import changed_ids, load_employer_ids, resolve_employer_ids, save_employer_ids
+from lmia_export import DEFAULT_PARQUET, parquet_columns_match, period_runs
+from lmia_periods import PeriodExport
+from lmia_sqlite import DEFAULT_DATABASE
+from lmia_report import RunReport
+from lmia_sniff import sniff, sniff_layout
+from lmia_manifest import (changed_resources, existing_period_chunks, load_manifest, manifest_entry,
+                           merge_into_master, save_manifest)
+from lmia_normalize import memory_mb, normalize_master, unconverted_counts, warn_unconverted, with_noc_labels
+from lmia_transform import split_noc
 
 ###############################################################################
-# Period 4: 2021-Q4 - 2024Q1
-# Build a function that will process the dataset.
-
-def process_2021_q4_to_2024_q1(df_from_dict):
-    # Extract the dataframe from the dictionary of DataFrames
-    df_name = pd.DataFrame.from_dict(all_dataframes[df_from_dict])
-    # Add proper raw names for the columns
-    df_name.columns = ['Province_raw', 'Stream_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Incorporate_status_raw', 'LMIAs_raw','Positions_raw']
-    # filter out unneccessary rows [such as Notes & repeated columns names]
-    df_name = df_name[((~df_name['Province_raw'].str.contains('Notes:', na=False))
-                                    & (~df_name['Province_raw'].str.contains('1. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('2. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('3. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('4. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('5. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('6. ', na=False))
-                                    & (~df_name['Province_raw'].str.contains('7. ', na=False))
-                                    & (df_name['Stream_raw'] != 'Program Stream')
-                                    & (df_name['Employer_raw'] != 'Employer')
-                                    & (df_name['Address_raw'] != 'Address')
-                                    & (df_name['NOC_raw'] != 'Occupation')
-                                    & (df_name['Incorporate_status_raw'] != 'Incorporate Status')
-                                    & (df_name['LMIAs_raw'] != 'Approved LMIAs')
-                                    & (df_name['Positions_raw'] != 'Approved Positions')
-                                    )]
-    # rename the column properly at the end by removin the 'raw' part
-    df_name = df_name.rename(columns={"Province_raw": "Province",
-                                                "Stream_raw":"Stream",
-                                                "Employer_raw": "Employer", 
-                                                "Address_raw": "Address",
-                                                "NOC_raw":"NOC",
-                                                "Incorporate_status_raw":"Incorporate_status",
-                                                "LMIAs_raw":"LMIAs",
-                                                "Positions_raw": "Positions"})
-    return(df_name)
-
-# Run the above function for each period [potential for automation] 
-
-employers_2021_q4 = process_2021_q4_to_2024_q1('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2021-employer-list2021q4finaltfwp_2')
-employers_2022_q1 = process_2021_q4_to_2024_q1('tfwp_2022q1_positive_en')
-employers_2022_q2 = process_2021_q4_to_2024_q1('tfwp_2022q2_positive_en')
-employers_2022_q3 = process_2021_q4_to_2024_q1('tfwp_2022q3_positive_en')
-employers_2022_q4 = process_2021_q4_to_2024_q1('tfwp_2022q4_pos_en')
-employers_2023_q1 = process_2021_q4_to_2024_q1('tfwp_2023q1_pos_en')
-employers_2023_q2 = process_2021_q4_to_2024_q1('tfwp_2023q2_pos_en')
-employers_2023_q3 = process_2021_q4_to_2024_q1('tfwp_2023q3_pos_en')
-employers_2023_q4 = process_2021_q4_to_2024_q1('tfwp_2023q4_pos_en')
-employers_2024_q1 = process_2021_q4_to_2024_q1('tfwp_2024q1_pos_en')
+# Output files
 
-###############################################################################
-# Add the Year and period columns to each dataset 
-# [potential for more automation in the future]
-
-datasets_final = [
-    employers_2014, employers_2015, employers_2016,
-    employers_2017_q1_q2, employers_2017_q3, employers_2017_q4,
-    employers_2018_q1, employers_2018_q2, employers_2018_q3, employers_2018_q4,
-    employers_2019_q1, employers_2019_q2, employers_2019_q3, employers_2019_q4,
-    employers_2020_q1, employers_2020_q2, employers_2020_q3, employers_2020_q4,
-    employers_2021_q1, employers_2021_q2, employers_2021_q3, employers_2021_q4, 
-    employers_2022_q1, employers_2022_q2, employers_2022_q3, employers_2022_q4, 
-    employers_2023_q1, employers_2023_q2, employers_2023_q3, employers_2023_q4,
-    employers_2024_q1]
-
-years_final = [
-    '2014', '2015', '2016',
-    '2017', '2017', '2017',
-    '2018', '2018', '2018', '2018',
-    '2019', '2019', '2019', '2019',
-    '2020', '2020', '2020', '2020',
-    '2021', '2021', '2021', '2021',
-    '2022', '2022', '2022', '2022',
-    '2023', '2023', '2023', '2023',
-    '2024'
-    ]
-
-period_final = [
-    '', '', '',
-    'Q1-Q2', 'Q3', 'Q4',
-    'Q1', 'Q2', 'Q3', 'Q4',
-    'Q1', 'Q2', 'Q3', 'Q4',
-    'Q1', 'Q2', 'Q3', 'Q4',
-    'Q1', 'Q2', 'Q3', 'Q4',
-    'Q1', 'Q2', 'Q3', 'Q4',
-    'Q1', 'Q2', 'Q3', 'Q4',
-    'Q1'
-    ]
-
-for (dataset, year, period) in zip(datasets_final, years_final, period_final):
-    dataset['YEAR'] = year
-    dataset['PERIOD'] = period
-    
-employers_2023_q2.head()
-employers_2024_q1.tail()
-
-# Merge all dataframes into one master dataframe
-master_df = pd.concat(datasets_final)
-master_df.describe()
-
-# Final touch - split NOC column in 2: NOC code and NOC label
-master_df['NOC_code'] = master_df['NOC'].str[:4]
-master_df['NOC_label'] = master_df['NOC'].str[5:]
-
-###############################################################################
-# Export the data to a sinfle master file
 master_df_name = 'Employer_list_positive_LMIA_Canada.csv'
-
-print('Export the master file to 1 single csv file: ' + master_df_name)
-master_df.to_csv(master_df_name)
-print('Exported ' + master_df_name + '\n')
-
-###############################################################################
-# Split the dataframe into smaller chunks and export each chunk to csv
+manifest_name = 'Employer_list_positive_LMIA_Canada_manifest.json'
+# Employer_id of every (name, postal code, province) record, kept from one run to the next
+# (also on a full rebuild, so the ids stay stable). See lmia_entities.py
+employer_ids_name = 'Employer_list_positive_LMIA_Canada_employer_ids.csv'
 # Define the number of rows per each file exported:
 rows_per_file = 100000
 # Define the filename (it wil contain _the_file_number appended):
 base_filename = 'Employer_list_positive_LMIA_Canada'
-
-print('Splitting the master ' + master_df_name + ' file into multiple csv files of ' 
-      + str(rows_per_file) + 'rows each')
-
-# Build the split and export function
-def split_and_export_csv(df, rows_per_file, base_filename):
-    # Calculate the number of files needed
-    num_files = (len(df) // rows_per_file) + (1 if len(df) % rows_per_file != 0 else 0)
-    # Loop and save each subset
-    for i in range(num_files):
-        start_row = i * rows_per_file
-        end_row = (i + 1) * rows_per_file
-        chunk = df.iloc[start_row:end_row]
-        print('Started the export of ' + f'{base_filename}_{i+1}.csv')
-        chunk.to_csv(f'{base_filename}_{i+1}.csv')
-        print(f'Exported {base_filename}_{i+1}.csv' + '\n')
-
-
-# Run the export function
-split_and_export_csv(master_df, rows_per_file, base_filename)
+# Parquet dataset partitioned by YEAR / PERIOD
+parquet_name = DEFAULT_PARQUET
+# Aggregates for the dashboards (see lmia_cube.py)
+cube_name = 'Employer_list_positive_LMIA_Canada_cube.csv'
+top_employers_name = 'Employer_list_positive_LMIA_Canada_top_employers.csv'
+# New, dropped and changed employers of every period (see lmia_delta.py)
+delta_name = 'Employer_list_positive_LMIA_Canada_delta.csv'
+# Lookup table of the NOC codes (NOC 2011 and NOC 2021) with their label (see lmia_normalize.py)
+noc_name = 'Employer_list_positive_LMIA_Canada_noc.csv'
+
+
+def output_names():
+    # The files written one period at a time by the streaming and out-of-core modes (see lmia_periods.py)
+    return {'master': master_df_name, 'base': base_filename, 'parquet': parquet_name, 'cube': cube_name,
+            'top_employers': top_employers_name, 'delta': delta_name, 'noc': noc_name}
+
+
+def transform_resources(engine, resources_changed, raw_resources, source_hashes, manifest, report):
+    # Parse the changed resources with an engine (see lmia_engine.py) and process them into
+    # one table per (YEAR, PERIOD): a DataFrame of an in-memory engine, a table of an
+    # out-of-core engine. Every resource gets its entry in the manifest
+    report.start('parse', profile=True)
+    parsed = engine.read([raw_resources[name] + (LAYOUTS.get(process),)
+                          for (name, process, _, _) in resources_changed])
+    layouts = {}
+    raw_tables = {}
+    for (name, _, _, _), (layout, raw) in zip(resources_changed, parsed):
+        layouts[name] = layout
+        if layout is None:
+            print('Skipped ' + name + '.' + raw_resources[name][0] + ': its columns match no known layout\n')
+            continue
+        raw_tables[name] = raw
+        print(u'\u2713' + ' Successfully extracted ' + name + '.' + raw_resources[name][0]
+              + ' (layout ' + layout + ')\n')
+    del parsed
+    report.finish('parse', resources=len(resources_changed), engine=engine.name,
+                  rows_out=sum(engine.rows(raw) for raw in raw_tables.values()))
+
+    process = engine.process_table if engine.out_of_core else engine.process
+    tables = {}
+    report.start('transform', profile=True)
+    for (name, _, year, period) in resources_changed:
+        if layouts[name] is None:
+            manifest[name] = manifest_entry(source_hashes[name], 0, year, period, None)
+            continue
+        report.start(name)
+        rows_in = engine.rows(raw_tables[name])
+        # the raw table is not needed anymore
+        tables[(year, period)] = process(raw_tables.pop(name), layouts[name])
+        rows = engine.rows(tables[(year, period)])
+        report.finish_resource(name, 'transform', rows_in=rows_in, rows_out=rows)
+        manifest[name] = manifest_entry(source_hashes[name], rows, year, period, layouts[name])
+    report.finish('transform', rows_out=sum(engine.rows(table) for table in tables.values()))
+    return tables
+
+
+def export_periods(args, master_path, periods, new_periods, report):
+    # Export the master rows one period at a time (see lmia_periods.py): the master csv
+    # file and its splits, the Parquet partitions, the SQLite database and the aggregates.
+    # periods gives ((YEAR, PERIOD), rows, ids_changed) of every period in order, where
+    # ids_changed tells that an Employer_id of an existing period changed (or was missing).
+    # Only the Parquet partitions and the aggregate slices of the new periods (new_periods)
+    # and of the ones with a changed Employer_id are written again, unless they are rebuilt
+    print('Export the master file ' + master_path + ' and its splits of about '
+          + str(rows_per_file) + ' rows each')
+    report.start('export', profile=True)
+    parquet_rebuild = (args.full_rebuild or not os.path.exists(parquet_name)
+                       or not parquet_columns_match(parquet_name))
+    aggregates_rebuild = args.full_rebuild or not all(os.path.exists(name) for name in
+                                                      (cube_name, top_employers_name, delta_name))
+    export = PeriodExport(output_names(), rows_per_file, compression=args.compression,
+                          parquet_rebuild=parquet_rebuild, database=DEFAULT_DATABASE if args.sqlite else None,
+                          changed_periods=None if aggregates_rebuild else set(new_periods))
+    id_periods = 0
+    for key, rows, ids_changed in periods:
+        id_periods += ids_changed
+        export.start_period(key)
+        export.write(rows, parquet=parquet_rebuild or key in new_periods or ids_changed)
+        export.finish_period(ids_changed)
+    written = export.close()
+    print(str(id_periods) + ' periods with a changed Employer_id')
+    print('Exported ' + parquet_name + '\n')
+    report.finish('export', rows_out=export.rows_written, bytes=os.path.getsize(master_path),
+                  files_written=len(written), noc_codes=len(export.noc_df), unconverted_counts=export.unconverted)
+
+
+def parse_args(argv=None):
+    # command line options
+    parser = argparse.ArgumentParser(description='Extract, transform and export the positive LMIA employers list')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help='maximum number of files downloaded at the same time')
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                        help='number of processes parsing the csv and Excel files')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='folder of the local cache of the raw files')
+    parser.add_argument('--catalog', choices=list(CATALOGS), default='api',
+                        help='list the files with the catalog API (JSON) or the HTML dataset page')
+    parser.add_argument('--catalog-file',
+                        help='read the catalog from a local file (e.g. fixtures/package_show.json) instead of the portal')
+    parser.add_argument('--offline', action='store_true',
+                        help='rebuild everything from the local cache, without any network request')
+    parser.add_argument('--full-rebuild', action='store_true',
+                        help='process every resource again, even the ones that did not change')
+    parser.add_argument('--stream', action='store_true',
+                        help='rebuild the outputs chunk by chunk, with a flat memory usage')
+    parser.add_argument('--chunksize', type=int, default=50000,
+                        help='number of rows read at once in the streaming mode')
+    parser.add_argument('--sqlite', action='store_true',
+                        help='also build the SQLite database ' + DEFAULT_DATABASE + ' (indexed, with full-text search)')
+    parser.add_argument('--engine', choices=ENGINES, default='pandas',
+                        help='engine of the period transforms (see lmia_engine.py)')
+    parser.add_argument('--memory-limit',
+                        help='memory limit of the duckdb engine, e.g. 2GB. Its tables spill to disk past it')
+    parser.add_argument('--compression', choices=['gzip'],
+                        help='compress the master csv file and its splits (.csv.gz)')
+    parser.add_argument('--report', default='run_report.json',
+                        help='JSON report of the run (time, rows, bytes and memory of each stage and resource)')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='profile the hot stages with cProfile and write one .prof file per stage to DIR')
+    args = parser.parse_args(argv)
+    if args.stream and args.engine != 'pandas':
+        parser.error('the streaming mode reads the files in chunks with pandas, it does not use --engine')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # the csv files get a .gz extension when they are compressed
+    master_path = master_df_name + ('.gz' if args.compression == 'gzip' else '')
+
+    # every stage and every resource is measured and written to the run report (see lmia_report.py)
+    report = RunReport(args.profile)
+
+    # read the list of files from the catalog of the portal (see lmia_catalog.py)
+    # one pooled HTTP session is shared by the catalog request and all the downloads.
+    # The catalog and the raw files are kept in a local cache and revalidated on every run
+    session = build_session(args.workers)
+    cache = RawCache(args.cache_dir)
+    report.start('catalog')
+    catalog_stats = {}
+    if args.catalog_file:
+        with open(args.catalog_file, 'rb') as f:
+            catalog_content = f.read()
+    else:
+        catalog_content = fetch_resource(session, CATALOGS[args.catalog], cache=cache, offline=args.offline,
+                                         stats=catalog_stats)
+    df_links = read_catalog('html' if args.catalog_file and args.catalog_file.endswith('.html') else args.catalog,
+                            catalog_content)
+    report.finish('catalog', catalog=args.catalog_file or args.catalog, files=len(df_links), **catalog_stats)
+
+    # we'll focus on English first. Scrape and download English files.
+    # The files whose last modified date and size did not change in the catalog are not requested
+    file_name_en_list, file_format_en_list, links_en_list, stamps_en_list = english_links(df_links)
+
+    # download all the files at the same time. The raw bytes are kept in a dictionary
+    # {file_name: (file_format, bytes)}, so only the new or changed files are read later.
+    # In --stream mode the files are only downloaded or revalidated into the cache
+    # (the bytes are None) and every file is read back from the cache when its turn
+    # comes, so the memory does not grow with the history of the files
+    report.start('download')
+    download_stats = {}
+    raw_resources = download_resources(file_name_en_list, file_format_en_list, links_en_list,
+                                       max_workers=args.workers, session=session,
+                                       cache=cache, offline=args.offline, stats=download_stats,
+                                       catalog_stamps=stamps_en_list, keep_content=not args.stream)
+    links = dict(zip(file_name_en_list, links_en_list))
+
+    def raw_content(name):
+        # The raw bytes of a resource, from the cache when they were not kept
+        content = raw_resources[name][1]
+        return cache.load(links[name]) if content is None else content
+
+    for name, stats in download_stats.items():
+        report.add_resource(name, download=stats)
+    report.finish('download', resources=len(raw_resources),
+                  bytes=sum(stats['bytes'] for stats in download_stats.values()),
+                  bytes_downloaded=sum(stats['bytes_downloaded'] for stats in download_stats.values()))
+
+    # print the dictionary keys
+    for key in raw_resources.keys():
+        print(key)
+
+    # the resources are registered in lmia_catalog.py. The files of new quarters
+    # are added from their name when their header has a known layout (see lmia_sniff.py)
+    resources_final = route_resources(
+        raw_resources, RESOURCES, lambda name: sniff_layout(raw_content(name), raw_resources[name][0]) is not None)
+
+    ###########################################################################
+    # Incremental run: compare the raw files with the manifest of the last run
+    # and only process the resources that are new or changed. The steps after
+    # the merge still run over all the rows (see lmia_manifest.py)
+
+    # every file is in the cache, which keeps the sha256 of its content
+    source_hashes = {name: cache.lookup(links[name])['sha256'] for name in raw_resources}
+    manifest = load_manifest(manifest_name)
+    # without the master file there is nothing to merge into, so everything is processed again
+    if args.full_rebuild or not os.path.exists(master_path):
+        manifest = {}
+
+    changed_names = changed_resources(manifest, [name for (name, _, _, _) in resources_final], source_hashes)
+    if not changed_names:
+        print('No new or changed resources since the last run. Nothing to export.')
+        report.write(args.report, mode='no change', changed_resources=[])
+        return
+    print('There are ', len(changed_names), ' new or changed resources to process')
+
+    # the changed resources are read and transformed by an engine (see lmia_engine.py),
+    # in memory or out-of-core. The streaming mode reads the files in chunks itself
+    resources_changed = [(name, process, year, period) for (name, process, year, period) in resources_final
+                         if name in changed_names]
+    engine = None if args.stream else get_engine(args.engine, args.parse_workers, args.memory_limit)
+
+    if args.stream:
+        ###########################################################################
+        # Streaming mode: every resource is read in chunks, transformed and written
+        # to the master file and its splits right away. The forward-filled values
+        # (Province, Stream) are carried from one chunk to the next in fill_state.
+        # The Employer_id needs all the rows at once, so it is left empty in this mode
+        print('Streaming all the resources in chunks of ' + str(args.chunksize) + ' rows')
+        report.start('stream', profile=True)
+        export = PeriodExport(output_names(), rows_per_file, compression=args.compression,
+                              database=DEFAULT_DATABASE if args.sqlite else None)
+        for resource_number, (name, process, year, period) in enumerate(resources_final):
+            if name not in raw_resources:
+                # a resource missing from the catalog keeps its rows of the existing
+                # master file, like in merge_into_master (see lmia_manifest.py), without
+                # their Employer_id like the other rows of this mode
+                export.start_period((year, period))
+                for chunk_number, rows in enumerate(existing_period_chunks(master_path, (year, period),
+                                                                           args.chunksize)):
+                    export.write(rows.assign(Employer_id=None), replace=False,
+                                 basename_template=f'part-{resource_number}-{chunk_number}-{{i}}.parquet')
+                export.finish_period()
+                continue
+            # the raw bytes of one resource at a time, released once the resource is processed
+            format = raw_resources[name][0]
+            content = raw_content(name)
+            # the first rows give the layout, the header row and the columns to read (see lmia_sniff.py)
+            layout, read_options = sniff(content, format, LAYOUTS.get(process))
+            if layout is None:
+                del content
+                print('Skipped ' + name + '.' + format + ': its columns match no known layout\n')
+                manifest[name] = manifest_entry(source_hashes[name], 0, year, period, None)
+                continue
+            process = PROCESSORS[layout]
+            fill_state = {}
+            rows_in = 0
+            rows = 0
+            # a file with only its header gives no chunk
+            chunks = 0
+            report.start(name)
+            export.start_period((year, period))
+            for chunk_number, chunk in enumerate(iter_resource_chunks(content, format, args.chunksize,
+                                                                                **read_options)):
+                rows_in += len(chunk)
+                dataset = process(chunk, fill_state)
+                dataset['YEAR'] = year
+                dataset['PERIOD'] = period
+                # one Parquet file per chunk in the partition of the resource
+                export.write(split_address(split_noc(dataset)), replace=False,
+                             basename_template=f'part-{resource_number}-{chunk_number}-{{i}}.parquet')
+                rows += len(dataset)
+                chunks += 1
+            del content
+            # the aggregates of the chunks are added up for the whole resource
+            export.finish_period()
+            print(u'\u2713' + ' Successfully streamed ' + name + '.' + format + '\n')
+            report.finish_resource(name, 'stream', chunks=chunks, rows_in=rows_in, rows_out=rows)
+            manifest[name] = manifest_entry(source_hashes[name], rows, year, period, layout)
+        export.close()
+        report.finish('stream', rows_out=export.rows_written, unconverted_counts=export.unconverted)
+
+    elif engine.out_of_core:
+        ###########################################################################
+        # Out-of-core mode (see lmia_engine.py): the changed resources are loaded
+        # and processed in the tables of the engine (DuckDB), merged there with the
+        # existing master file and the NOC is split with SQL. The tables spill to
+        # disk past --memory-limit. Only the distinct addresses and employer
+        # records come to pandas (to parse the addresses and match the employer
+        # names), then the rows come back one period at a time for the exports
+        print('-----Loading ' + str(len(resources_changed)) + ' files in DuckDB with up to '
+              + str(args.parse_workers) + ' threads')
+        period_tables = transform_resources(engine, resources_changed, raw_resources, source_hashes, manifest,
+                                            report)
+        rows_new = sum(engine.rows(table) for table in period_tables.values())
+
+        # Merge the new periods with the existing master file and split the NOC column
+        report.start('merge')
+        rows_total = engine.merge(period_tables, [(year, period) for (_, _, year, period) in resources_final],
+                                  master_path)
+        report.finish('merge', rows_in=rows_new, rows_out=rows_total)
+
+        # Split the Address (see lmia_address.py) and match the employer names
+        # (see lmia_entities.py) on the distinct values only
+        print('Matching the employer names')
+        report.start('employer ids', profile=True)
+        addresses = engine.distinct(['Address'])
+        engine.join(pd.concat([addresses, parse_addresses(addresses['Address'])], axis=1), ['Address'])
+        records = engine.distinct(['Employer', 'Address'])
+        employer_ids, employer_id_map = resolve_employer_ids(records, load_employer_ids(employer_ids_name))
+        engine.join(records.assign(Employer_id=employer_ids.to_numpy()), ['Employer', 'Address'])
+        report.finish('employer ids', rows_in=len(records), employers=employer_ids.nunique())
+
+        # The existing periods whose Employer_id changed (or was missing) are written again
+        periods = ((key, dataset, key not in period_tables
+                    and changed_ids(dataset.pop('old_Employer_id'), dataset['Employer_id']).any())
+                   for key, dataset in engine.periods())
+        export_periods(args, master_path, periods, period_tables, report)
+
+    else:
+        # Read only the changed resources. The files are parsed in a pool of processes
+        # and handed back in the order of resources_final, with the layout of their header
+        print('-----Parsing ' + str(len(resources_changed)) + ' files with the ' + engine.name
+              + ' engine and up to ' + str(args.parse_workers) + ' workers')
+        datasets_final = transform_resources(engine, resources_changed, raw_resources, source_hashes, manifest,
+                                             report)
+        rows_new = sum(len(dataset) for dataset in datasets_final.values())
+
+        # Merge the new datasets into the existing master dataframe
+        report.start('merge')
+        master_df = merge_into_master(master_path, datasets_final,
+                                      [(year, period) for (_, _, year, period) in resources_final])
+        new_periods = set(datasets_final)
+        del datasets_final
+        master_df.describe()
+
+        # Final touch - split NOC column in 2: NOC code and NOC label
+        master_df = engine.split_noc(master_df)
+
+        # Split the Address in City, Province_code, Postal_code and FSA (see lmia_address.py)
+        master_df = split_address(master_df)
+        report.finish('merge', rows_in=rows_new, rows_out=len(master_df))
+
+        # Give the same Employer_id to the rows of the same employer, even when the
+        # name is spelled differently (see lmia_entities.py)
+        print('Matching the employer names')
+        report.start('employer ids', profile=True)
+        employer_ids, employer_id_map = resolve_employer_ids(master_df, load_employer_ids(employer_ids_name))
+        # The existing rows whose id changed (e.g. two employers merged by a new quarter)
+        # or had no id (a master written by --stream): their periods are written again
+        # like the new ones
+        if 'Employer_id' in master_df:
+            id_changed = changed_ids(master_df['Employer_id'], employer_ids)
+        else:
+            id_changed = np.ones(len(master_df), dtype=bool)
+        id_periods = set(zip(master_df['YEAR'][id_changed], master_df['PERIOD'].fillna('')[id_changed]))
+        master_df['Employer_id'] = employer_ids.to_numpy()
+        report.finish('employer ids', rows_in=len(master_df), employers=master_df['Employer_id'].nunique())
+
+        # Compact dtypes: integer counts and categoricals (see lmia_normalize.py).
+        # The exports get the NOC_label column back from the distinct NOC values
+        report.start('normalize')
+        memory_before = memory_mb(master_df)
+        unconverted = unconverted_counts(master_df)
+        warn_unconverted(unconverted)
+        master_df = normalize_master(master_df)
+        memory_after = memory_mb(master_df)
+        print(f'master_df uses {memory_after:.1f} MB instead of {memory_before:.1f} MB '
+              f'({memory_before / max(memory_after, 1e-6):.1f} times less)')
+        report.finish('normalize', rows_in=len(master_df), mb_before=round(memory_before, 1),
+                      mb_after=round(memory_after, 1), unconverted_counts=unconverted)
+
+        periods = ((key, rows, key not in new_periods and key in id_periods)
+                   for key, rows in period_runs(with_noc_labels(master_df)))
+        export_periods(args, master_path, periods, new_periods, report)
+
+    # Record the processed resources (and the Employer_id of the records) for the next run
+    save_manifest(manifest_name, manifest)
+    if not args.stream:
+        save_employer_ids(employer_ids_name, employer_id_map)
+    print('Updated the manifest ' + manifest_name)
+    if args.stream:
+        mode = 'stream'
+    elif engine.out_of_core:
+        mode = 'out-of-core'
+    else:
+        mode = 'in memory'
+    report.write(args.report, mode=mode,
+                 changed_resources=[name for (name, _, _, _) in resources_final if name in changed_names])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Address parsing.
+# The Address column is free text such as "Brampton, ON L6S 6B5" (sometimes
+# with a street before the city). It is split into City, Province_code,
+# Postal_code and FSA (forward sortation area: the first 3 characters of the
+# postal code) with vectorized string operations on the distinct addresses.
+# When the address has no province code, it comes from the postal code and
+# the offline reference table reference/provinces.csv.
+# FsaIndex maps the FSA to the rows, so "all approvals in L6*" is a binary
+# search instead of a scan of the addresses.
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from lmia_entities import POSTAL_CODE_PATTERN, PROVINCE_CODE_PATTERN
+
+ADDRESS_COLUMNS = ['City', 'Province_code', 'Postal_code', 'FSA']
+REFERENCE_PROVINCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reference', 'provinces.csv')
+# the city is the text between the last comma before the province code and the province code
+CITY_PATTERN = r'([^,]+)' + PROVINCE_CODE_PATTERN
+
+_postal_districts = None
+
+
+def postal_districts():
+    # {postal code prefix (letter or FSA): province code} of the reference table
+    global _postal_districts
+    if _postal_districts is None:
+        provinces = pd.read_csv(REFERENCE_PROVINCES, dtype=str, keep_default_na=False)
+        _postal_districts = {prefix: code for code, prefixes in
+                             zip(provinces['Province_code'], provinces['Postal_districts'])
+                             for prefix in prefixes.split()}
+    return _postal_districts
+
+
+def province_from_postal_codes(postal_codes):
+    # Province code of the postal codes: the FSA first (e.g. X0A in Nunavut), then the first letter
+    districts = postal_districts()
+    by_fsa = postal_codes.str[:3].map(districts)
+    by_letter = postal_codes.str[:1].map(districts)
+    return by_fsa.fillna(by_letter).fillna('')
+
+
+def parse_addresses(addresses):
+    # DataFrame of City, Province_code, Postal_code and FSA with the index of the addresses.
+    # Only the distinct addresses are parsed
+    codes, uniques = pd.factorize(addresses.astype(object).fillna('').astype(str))
+    distinct = pd.Series(uniques, dtype=object)
+    upper = distinct.str.upper()
+    postal = upper.str.extract(POSTAL_CODE_PATTERN)
+    postal_code = (postal[0] + ' ' + postal[1]).fillna('')
+    province_code = upper.str.extract(PROVINCE_CODE_PATTERN)[0]
+    province_code = province_code.fillna(province_from_postal_codes(postal_code))
+    city = distinct.str.extract(CITY_PATTERN, flags=re.IGNORECASE)[0]
+    city = city.str.strip().str.replace(r'\s+', ' ', regex=True)
+    parsed = pd.DataFrame({'City': city.fillna(''), 'Province_code': province_code,
+                           'Postal_code': postal_code, 'FSA': postal_code.str[:3]})
+    # empty values are kept empty, like the other text columns
+    parsed = parsed.where(parsed != '', None)
+    return pd.DataFrame(parsed.to_numpy()[codes] if len(codes) else np.empty((0, len(ADDRESS_COLUMNS))),
+                        columns=ADDRESS_COLUMNS, index=addresses.index)
+
+
+def split_address(df_name):
+    # Add the City, Province_code, Postal_code and FSA columns parsed from the Address
+    parsed = parse_addresses(df_name['Address'])
+    for column in ADDRESS_COLUMNS:
+        df_name[column] = parsed[column]
+    return(df_name)
+
+
+class FsaIndex:
+    # Sorted FSA of every row and the row positions in the same order.
+    # A prefix (L, L6, L6S) is found with two binary searches
+
+    def __init__(self, fsa):
+        values = fsa.astype(object).fillna('').astype(str).to_numpy().astype('U3')
+        self.rows = np.argsort(values, kind='stable')
+        self.keys = values[self.rows]
+
+    def lookup(self, prefix):
+        # Positions (iloc) of the rows whose FSA starts with the prefix, e.g. 'L6' or 'L6*'
+        prefix = prefix.upper().rstrip('*')[:3]
+        start = np.searchsorted(self.keys, prefix, side='left')
+        end = np.searchsorted(self.keys, prefix + '\uffff', side='left')
+        return np.sort(self.rows[start:end])
+
+    def counts(self):
+        # Number of rows of every FSA
+        fsa, counts = np.unique(self.keys[self.keys != ''], return_counts=True)
+        return pd.Series(counts, index=fsa, name='Rows')
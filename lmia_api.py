@@ -0,0 +1,102 @@
+# Library API of the positive LMIA employers list.
+# Importing this module does no I/O: the dataset page and the files are only
+# fetched when a function is called, and only for the requested years/periods.
+#
+#   import lmia_api
+#   df = lmia_api.load(years=2024, periods='Q1')          # from the source files
+#   df = lmia_api.load_exported(years=[2023, 2024])       # from the Parquet export
+#   df = lmia_api.read_csv_slices(years=2024)             # from the csv export (lmia_offsets.py)
+#
+# The building blocks stay importable on their own, e.g.
+#   from lmia_transform import process_2016
+#   from lmia_export import split_and_export_csv
+
+import pandas as pd
+
+from lmia_address import split_address
+from lmia_cache import DEFAULT_CACHE_DIR, RawCache
+from lmia_catalog import (CATALOGS, RESOURCES, english_links, infer_period, read_catalog, route_resources,
+                          select_resources)
+from lmia_download import (DEFAULT_MAX_WORKERS, DEFAULT_PARSE_WORKERS, build_session, download_resources,
+                           fetch_resource, read_resources)
+from lmia_engine import LAYOUTS, PROCESSORS
+from lmia_export import DEFAULT_PARQUET
+from lmia_offsets import read_csv_slices
+from lmia_sniff import read_sniffed, sniff_layout
+from lmia_transform import MASTER_COLUMNS, split_noc
+
+# The functions of the API, read_csv_slices included (it comes from lmia_offsets.py)
+__all__ = ['resource_links', 'load', 'load_exported', 'read_csv_slices', 'available_periods']
+
+
+def resource_links(session=None, cache=None, offline=False, catalog='api'):
+    # {file_name: (file_format, link, catalog_stamp)} of the English files of the catalog
+    if session is None:
+        session = build_session()
+    df_links = read_catalog(catalog, fetch_resource(session, CATALOGS[catalog], cache=cache, offline=offline))
+    names, formats, links, stamps = english_links(df_links)
+    return {name: (format, link, stamp) for (name, format, link, stamp) in zip(names, formats, links, stamps)}
+
+
+def load(years=None, periods=None, cache_dir=DEFAULT_CACHE_DIR, offline=False,
+         workers=DEFAULT_MAX_WORKERS, parse_workers=DEFAULT_PARSE_WORKERS, catalog='api'):
+    # Fetch, parse and transform the resources of the given years and periods
+    # (every resource by default) and return their rows with the master columns.
+    # The Employer_id is left empty: it needs the rows of every period
+    session = build_session(workers)
+    cache = RawCache(cache_dir) if cache_dir else None
+    links = resource_links(session, cache=cache, offline=offline, catalog=catalog)
+
+    # the files of new quarters are routed like in the pipeline (see route_resources),
+    # from their name and their header. Only the files of the requested periods are fetched
+    raw_resources = {}
+
+    def is_employer_list(name):
+        format, link, stamp = links[name]
+        raw_resources[name] = (format, fetch_resource(session, link, cache=cache, offline=offline,
+                                                      catalog_stamp=stamp))
+        return sniff_layout(raw_resources[name][1], format) is not None
+
+    candidates = [name for name in links
+                  if infer_period(name) is not None and select_resources(years, periods,
+                                                                         [(name, None) + infer_period(name)])]
+    selected = select_resources(years, periods, route_resources(candidates, RESOURCES, is_employer_list))
+    if not selected:
+        raise ValueError('No resource for years=' + str(years) + ' and periods=' + str(periods))
+    missing = [name for (name, _, _, _) in selected if name not in links]
+    if missing:
+        raise KeyError('Resources not listed in the catalog: ' + ', '.join(missing))
+    names = [name for (name, _, _, _) in selected if name not in raw_resources]
+    raw_resources.update(download_resources(names, [links[name][0] for name in names],
+                                            [links[name][1] for name in names],
+                                            max_workers=workers, session=session, cache=cache, offline=offline,
+                                            catalog_stamps=[links[name][2] for name in names]))
+    # the layout of every file comes from its header (see lmia_sniff.py)
+    parsed_frames = read_resources([raw_resources[name] + (LAYOUTS.get(process),)
+                                    for (name, process, _, _) in selected],
+                                   parse_workers, reader=read_sniffed)
+    datasets = []
+    for (name, process, year, period), (layout, df_raw) in zip(selected, parsed_frames):
+        dataset = PROCESSORS[layout](df_raw)
+        dataset['YEAR'] = year
+        dataset['PERIOD'] = period
+        datasets.append(dataset)
+    return split_address(split_noc(pd.concat(datasets))).reindex(columns=MASTER_COLUMNS)
+
+
+def load_exported(years=None, periods=None, path=DEFAULT_PARQUET, columns=None):
+    # Read the rows of the given years and periods from the Parquet export.
+    # Only the matching partitions (and columns) are read
+    filters = []
+    if years is not None:
+        years = [years] if isinstance(years, (str, int)) else years
+        filters.append(('YEAR', 'in', [str(year) for year in years]))
+    if periods is not None:
+        periods = [periods] if isinstance(periods, str) else periods
+        filters.append(('PERIOD', 'in', list(periods)))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+
+def available_periods(resources=RESOURCES):
+    # The (YEAR, PERIOD) of every registered resource
+    return [(year, period) for (_, _, year, period) in resources]
@@ -0,0 +1,112 @@
+# Local on-disk cache of the raw LMIA resources.
+# The raw files are stored by the sha256 of their content (content-addressed)
+# and an index maps every URL to its blob and to the ETag / Last-Modified
+# headers returned by the server, so the next run can revalidate the file
+# with a conditional request instead of downloading it again.
+# The index also keeps the last-modified date and size announced by the
+# catalog (catalog_stamp): while they do not change, the file is not requested.
+# When a URL gets new content, its old blob is removed unless another URL still
+# points to it, so the cache does not grow with every revision of a file.
+
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'lmia_raw')
+
+
+class RawCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def lookup(self, url):
+        # Return the index entry of a URL, only if its blob is still on disk
+        entry = self.index.get(url)
+        if entry is None or not os.path.exists(self.blob_path(entry['sha256'])):
+            return None
+        return entry
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256)
+
+    def conditional_headers(self, url):
+        # Headers for a conditional request revalidating the cached copy of a URL
+        entry = self.lookup(url)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_current(self, url, catalog_stamp):
+        # True when the cached copy of a URL has the same catalog stamp as the catalog of this run
+        entry = self.lookup(url)
+        return catalog_stamp is not None and entry is not None and entry.get('catalog_stamp') == catalog_stamp
+
+    def set_catalog_stamp(self, url, catalog_stamp):
+        with self.lock:
+            if url in self.index:
+                self.index[url]['catalog_stamp'] = catalog_stamp
+                self.save_index()
+
+    def load(self, url):
+        # Read the cached bytes of a URL
+        entry = self.lookup(url)
+        if entry is None:
+            raise KeyError('No cached copy of ' + url)
+        with open(self.blob_path(entry['sha256']), 'rb') as f:
+            return f.read()
+
+    def store(self, url, content, etag=None, last_modified=None, catalog_stamp=None):
+        # Write the blob (once per distinct content) and point the URL to it.
+        # The blob the URL pointed to before is removed when no other URL points to it
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(sha256)
+        tmp_path = None
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp.' + str(threading.get_ident())
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+        with self.lock:
+            # the blob is moved in place under the lock, so it is never removed as an old blob in between
+            if tmp_path is not None:
+                os.replace(tmp_path, path)
+            elif not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(content)
+            old = self.index.get(url)
+            self.index[url] = {'sha256': sha256,
+                               'etag': etag,
+                               'last_modified': last_modified,
+                               'size': len(content),
+                               'catalog_stamp': catalog_stamp}
+            self.save_index()
+            if old is not None and old['sha256'] != sha256:
+                self.remove_unused_blob(old['sha256'])
+        return sha256
+
+    def remove_unused_blob(self, sha256):
+        # Remove a blob that no URL of the index points to anymore
+        if all(entry['sha256'] != sha256 for entry in self.index.values()):
+            path = self.blob_path(sha256)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
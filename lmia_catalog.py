@@ -0,0 +1,196 @@
+# Resources of the positive LMIA employers dataset.
+# The catalog API of the open data portal (CKAN package_show) lists every file
+# with its link, language, last modified date and size as a small JSON
+# payload. The HTML dataset page is still supported (catalog='html').
+# RESOURCES registers each English file with the function that processes
+# it, its Year and period. The files of new quarters are routed without being
+# registered: their Year and period come from the file name and their layout
+# from their header (see lmia_sniff.py). Nothing is downloaded at import time.
+
+import json
+import re
+
+import pandas as pd
+
+from lmia_transform import (process_2014_2015, process_2016, process_2017_q1_to_2021_q3,
+                            process_2021_q4_to_2024_q1)
+
+DATASET_ID = '90fed587-1364-4f33-a9ee-208181dc0b97'
+URL = "https://open.canada.ca/data/en/dataset/" + DATASET_ID
+API_URL = 'https://open.canada.ca/data/api/action/package_show?id=' + DATASET_ID
+CATALOGS = {'api': API_URL, 'html': URL}
+# package_show payload in the format of the portal (files on example.org), to test the catalog offline
+FIXTURE = 'fixtures/package_show.json'
+
+###############################################################################
+# Files don't have consistent names and values and
+# will be processed in different batches, one function per period (see lmia_transform.py).
+# Register each resource with the function that processes it, its Year and period
+# [the new quarters are found by route_resources]
+
+RESOURCES = [
+    ('positive_employers_en', process_2014_2015, '2014', ''),
+    ('2015_positive_employers_en', process_2014_2015, '2015', ''),
+    ('2016_positive_employer_en', process_2016, '2016', ''),
+    ('2017q1q2_positive_en', process_2017_q1_to_2021_q3, '2017', 'Q1-Q2'),
+    ('2017q3_positive_employer_stream_en', process_2017_q1_to_2021_q3, '2017', 'Q3'),
+    ('2017q4_positive_employer_en', process_2017_q1_to_2021_q3, '2017', 'Q4'),
+    ('2018q1_positive_employer_en', process_2017_q1_to_2021_q3, '2018', 'Q1'),
+    ('2018q2_positive_employer_en', process_2017_q1_to_2021_q3, '2018', 'Q2'),
+    ('2018q3_positive_en', process_2017_q1_to_2021_q3, '2018', 'Q3'),
+    ('2018q4_positive_en', process_2017_q1_to_2021_q3, '2018', 'Q4'),
+    ('tfwp_2019q1_employer_positive_en', process_2017_q1_to_2021_q3, '2019', 'Q1'),
+    ('tfwp_2019q2_employer_positive_en', process_2017_q1_to_2021_q3, '2019', 'Q2'),
+    ('tfwp_2019q3_positive_en', process_2017_q1_to_2021_q3, '2019', 'Q3'),
+    ('tfwp_2019q4_positive_en', process_2017_q1_to_2021_q3, '2019', 'Q4'),
+    ('tfwp_2020q1_positive_en', process_2017_q1_to_2021_q3, '2020', 'Q1'),
+    ('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2020-employer-list2020q22020q2csv202', process_2017_q1_to_2021_q3, '2020', 'Q2'),
+    ('tfwp_2020q3_positive_en', process_2017_q1_to_2021_q3, '2020', 'Q3'),
+    ('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2020-employer-list2020q4tfwp_2020q4', process_2017_q1_to_2021_q3, '2020', 'Q4'),
+    ('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2021-employer-listq1-2021tfwp_2021q', process_2017_q1_to_2021_q3, '2021', 'Q1'),
+    ('TFWP_2021Q2_Positive_EN', process_2017_q1_to_2021_q3, '2021', 'Q2'),
+    ('TFWP_2021Q3_Positive_EN', process_2017_q1_to_2021_q3, '2021', 'Q3'),
+    ('useb-dgcetfw-tetdip-piddiviaionline-publicationemployer-list2021-employer-list2021q4finaltfwp_2', process_2021_q4_to_2024_q1, '2021', 'Q4'),
+    ('tfwp_2022q1_positive_en', process_2021_q4_to_2024_q1, '2022', 'Q1'),
+    ('tfwp_2022q2_positive_en', process_2021_q4_to_2024_q1, '2022', 'Q2'),
+    ('tfwp_2022q3_positive_en', process_2021_q4_to_2024_q1, '2022', 'Q3'),
+    ('tfwp_2022q4_pos_en', process_2021_q4_to_2024_q1, '2022', 'Q4'),
+    ('tfwp_2023q1_pos_en', process_2021_q4_to_2024_q1, '2023', 'Q1'),
+    ('tfwp_2023q2_pos_en', process_2021_q4_to_2024_q1, '2023', 'Q2'),
+    ('tfwp_2023q3_pos_en', process_2021_q4_to_2024_q1, '2023', 'Q3'),
+    ('tfwp_2023q4_pos_en', process_2021_q4_to_2024_q1, '2023', 'Q4'),
+    ('tfwp_2024q1_pos_en', process_2021_q4_to_2024_q1, '2024', 'Q1'),
+    ]
+
+# Year and quarter in a file name: tfwp_2024q2_pos_en, ...list2021q4final..., ...listq1-2021tfwp...
+YEAR_QUARTER_PATTERNS = [re.compile(r'(20\d\d)[_-]?q([1-4])', re.IGNORECASE),
+                         re.compile(r'q([1-4])[_-]?(20\d\d)', re.IGNORECASE)]
+
+
+def infer_period(name):
+    # (YEAR, PERIOD) from the name of a file, None when it has no year and quarter
+    for number, pattern in enumerate(YEAR_QUARTER_PATTERNS):
+        match = pattern.search(name)
+        if match is not None:
+            year, quarter = match.groups() if number == 0 else match.groups()[::-1]
+            return year, 'Q' + quarter
+    return None
+
+
+def route_resources(names, resources=RESOURCES, is_employer_list=None):
+    # The registered resources and the unregistered files of the catalog whose
+    # name has a year and a quarter, in the order of the periods.
+    # is_employer_list (optional function of the name) checks an unregistered file,
+    # e.g. from its header, so a data dictionary of the quarter is not routed.
+    # The process function of an unregistered file is None: it is chosen from its header
+    registered = {name for (name, _, _, _) in resources}
+    periods = {(year, period) for (_, _, year, period) in resources}
+    routed = list(resources)
+    for name in names:
+        if name in registered:
+            continue
+        period = infer_period(name)
+        if period is None or period in periods:
+            continue
+        if is_employer_list is not None and not is_employer_list(name):
+            continue
+        print('New resource ' + name + ' routed to ' + ' '.join(period))
+        routed.append((name, None) + period)
+        periods.add(period)
+    return sorted(routed, key=lambda resource: (resource[2], resource[3]))
+
+
+def select_resources(years=None, periods=None, resources=RESOURCES):
+    # The registered resources of the given years and periods (all of them by default).
+    # A period given as 'Q2' also selects a combined period such as 'Q1-Q2'
+    if years is not None:
+        years = {str(year) for year in ([years] if isinstance(years, (str, int)) else years)}
+    if periods is not None:
+        periods = {periods} if isinstance(periods, str) else set(periods)
+    selected = []
+    for (name, process, year, period) in resources:
+        if years is not None and year not in years:
+            continue
+        if periods is not None and period not in periods and not periods & set(period.split('-')):
+            continue
+        selected.append((name, process, year, period))
+    return selected
+
+
+def parse_catalog(page_content):
+    # Read the links of the data files from the dataset page and return a
+    # DataFrame with data_link, data_language, file_name and file_format
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page_content, "html.parser")
+
+    # read URL's from HTML
+    url_list = soup.find_all("span", {"property":"url"})
+    print("There are ", len(url_list), " links with data")
+
+    # read the language of the datasets
+    lang_list = soup.find_all("span", {"property":"inLanguage"})
+    print("There are ", len(lang_list), " languages")
+
+    # remove 1st element from language list as it does not correspond to a dataset
+    lang_list.pop(0)
+    print("Now, there are ", len(lang_list), " languages")
+
+    # onvert the language list to a string list. Otherwise we end up with NULLs
+    lang_list_str = [str(elem) for elem in lang_list]
+
+    # create a dataframe based on the arrays above
+    df_links = pd.DataFrame({'data_link_raw':url_list, 'data_language_raw':lang_list_str})
+
+    # convert dataframe columns from object type to string
+    df_links['data_link_raw'] = df_links['data_link_raw'].astype('string')
+    df_links['data_language_raw'] = df_links['data_language_raw'].astype('string')
+
+    # replace al the unnecessary html tags in the column values
+    df_links['data_link'] = df_links['data_link_raw'].str.replace('<span property="url">', '').str.replace('</span>','')
+    df_links['data_language'] = df_links['data_language_raw'].str.replace('" property="inLanguage"> </span>', '').str.replace('<span content="','')
+
+    # add file_name and file_format in separate columns
+    df_links['file_name'] = df_links['data_link'].str.split('/').str[-1].str.split('.').str[0]
+    df_links['file_format'] = df_links['data_link'].str.split('.').str[-1]
+    # the page has no last modified date
+    df_links['catalog_stamp'] = None
+    return df_links[['data_link', 'data_language', 'file_name', 'file_format', 'catalog_stamp']]
+
+
+def parse_catalog_json(content):
+    # Read the files of the package_show payload and return the same DataFrame
+    # as parse_catalog, where catalog_stamp is the last modified date and the
+    # size of the file in the catalog (a file is not requested while it's unchanged)
+    package = json.loads(content)
+    if not package.get('success', True):
+        raise ValueError('The catalog API returned an error: ' + str(package.get('error')))
+    rows = []
+    for resource in package['result']['resources']:
+        language = resource.get('language') or ['']
+        if isinstance(language, list):
+            language = language[0] if language else ''
+        modified = resource.get('last_modified') or resource.get('metadata_modified') or ''
+        size = resource.get('size')
+        rows.append({'data_link': resource['url'], 'data_language': language,
+                     'catalog_stamp': modified + '|' + str(size) if modified or size else None})
+    print("There are ", len(rows), " files in the catalog")
+    df_links = pd.DataFrame(rows, columns=['data_link', 'data_language', 'catalog_stamp'])
+    file_name = df_links['data_link'].str.split('/').str[-1]
+    df_links['file_name'] = file_name.str.split('.').str[0]
+    df_links['file_format'] = file_name.str.split('.').str[-1].str.lower()
+    return df_links[['data_link', 'data_language', 'file_name', 'file_format', 'catalog_stamp']]
+
+
+def read_catalog(catalog, content):
+    # DataFrame of the files from the content of the catalog ('api' or 'html')
+    if catalog == 'html':
+        return parse_catalog(content)
+    return parse_catalog_json(content)
+
+
+def english_links(df_links):
+    # The English files only, as lists of names, formats, links and catalog stamps
+    df_links_en = df_links[df_links['data_language'] == 'en']
+    return (df_links_en['file_name'].tolist(), df_links_en['file_format'].tolist(),
+            df_links_en['data_link'].tolist(), df_links_en['catalog_stamp'].tolist())
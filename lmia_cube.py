@@ -0,0 +1,105 @@
+# Aggregates of the master DataFrame, materialized as small csv files:
+#   - approved positions and LMIAs by YEAR x PERIOD x Province x NOC_code x Stream
+#   - top employers of each year by approved positions (without the
+#     "Other employers" rows of 2014 / 2015, which are not an employer)
+# LMIAs are empty where no row of the slice has them (they were not
+# published before 2021-Q4).
+# When a quarter is processed again only its slice (or its year, for the top
+# employers) is recomputed and replaced, so the dashboards read the rollups
+# directly instead of scanning the master file.
+
+import os
+
+import pandas as pd
+
+from lmia_export import to_count
+from lmia_filters import AGGREGATE_EMPLOYERS
+
+CUBE_KEYS = ['YEAR', 'PERIOD', 'Province', 'NOC_code', 'Stream']
+TOTAL_COLUMNS = ['Positions', 'LMIAs', 'Rows']
+# Number of employers kept for each year
+TOP_EMPLOYERS = 100
+
+
+def totals_key(series):
+    # Key column as text ('' when empty)
+    return series.astype(object).where(series.notna(), '').astype(str).to_numpy()
+
+
+def with_counts(df, keys):
+    # Key columns as text and the counts as numbers
+    out = pd.DataFrame({key: totals_key(df[key]) for key in keys})
+    out['Positions'] = to_count(df['Positions']).fillna(0).to_numpy()
+    out['LMIAs'] = to_count(df['LMIAs']).array
+    out['Rows'] = 1
+    return out
+
+
+def combine(parts, keys):
+    # Add up partial aggregates (e.g. of several chunks) with the same keys
+    parts = [part for part in parts if len(part) > 0]
+    if not parts:
+        return pd.DataFrame(columns=keys + TOTAL_COLUMNS)
+    # missing LMIAs when no row of the key has them
+    return pd.concat(parts).groupby(keys, sort=True, as_index=False)[TOTAL_COLUMNS].sum(min_count=1)
+
+
+def quarter_cube(df):
+    # Positions, LMIAs and number of rows by YEAR x PERIOD x Province x NOC_code x Stream
+    return combine([with_counts(df, CUBE_KEYS)], CUBE_KEYS)
+
+
+def employer_totals(df):
+    # Positions, LMIAs and number of rows by YEAR and employer.
+    # The employer is its Employer_id when there is one, otherwise its name.
+    # The "Other employers" rows are left out
+    df = df[~df['Employer'].isin(AGGREGATE_EMPLOYERS).to_numpy()]
+    employer = df['Employer'].astype(object).fillna('')
+    if 'Employer_id' in df.columns:
+        employer = df['Employer_id'].astype(object).where(df['Employer_id'].notna(), employer)
+    df = df.assign(Employer_key=employer.to_numpy())
+    totals = combine([with_counts(df, ['YEAR', 'Employer_key'])], ['YEAR', 'Employer_key'])
+    # keep one name for each employer (its first name in the year)
+    names = (pd.DataFrame({'YEAR': totals_key(df['YEAR']),
+                           'Employer_key': employer.fillna('').astype(str).to_numpy(),
+                           'Employer': df['Employer'].fillna('').to_numpy()})
+             .drop_duplicates(['YEAR', 'Employer_key']))
+    return totals.merge(names, on=['YEAR', 'Employer_key'], how='left')
+
+
+def combine_employer_totals(parts):
+    # Add up the employer totals of several chunks
+    grouped = pd.concat(parts).groupby(['YEAR', 'Employer_key'])
+    totals = grouped.agg(Employer=('Employer', 'first'), Positions=('Positions', 'sum'))
+    # missing when no row of the employer has LMIAs
+    totals['LMIAs'] = grouped['LMIAs'].sum(min_count=1)
+    totals['Rows'] = grouped['Rows'].sum()
+    return totals.reset_index()
+
+
+def top_employers(totals, top=TOP_EMPLOYERS):
+    # The employers with the most approved positions in each year
+    totals = combine_employer_totals([totals])
+    totals = totals.sort_values(['YEAR', 'Positions', 'Employer_key'], ascending=[True, False, True])
+    totals = totals.groupby('YEAR', sort=False).head(top)
+    totals['Rank'] = totals.groupby('YEAR').cumcount() + 1
+    return totals[['YEAR', 'Rank', 'Employer_key', 'Employer', 'Positions', 'LMIAs', 'Rows']]
+
+
+def as_text(df):
+    # The columns as text, the missing values empty
+    return df.astype(object).where(df.notna(), '').astype(str)
+
+
+def update_aggregate(path, new_slices, key_columns, keys=None):
+    # Replace the slices of an aggregate file.
+    # keys: the values of key_columns whose rows are replaced by new_slices.
+    # Without keys (or without the file) the whole file is written again
+    if keys is not None and os.path.exists(path):
+        existing = pd.read_csv(path, dtype=str, keep_default_na=False)
+        existing_keys = list(zip(*[existing[column] for column in key_columns]))
+        keep = [key not in keys for key in existing_keys]
+        new_slices = pd.concat([existing[keep], as_text(new_slices)])
+    new_slices = as_text(new_slices).sort_values(key_columns, kind='stable')
+    new_slices.to_csv(path, index=False)
+    return new_slices
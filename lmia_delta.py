@@ -0,0 +1,72 @@
+# Quarter-over-quarter delta feed.
+# For every period, the employers that are new, the ones that dropped out and
+# the ones whose approved positions or LMIAs changed compared with the period
+# before it (in the order of the registered resources).
+# The rows are matched on a 64-bit hash of Employer / Address / NOC_code
+# (trimmed, upper case), so a delta only needs the totals of its two periods
+# and its cost does not grow with the history.
+# The LMIAs are only published from 2021-Q4: before, they are missing (not 0),
+# and they are compared only when both periods have them. A key whose LMIAs
+# are published for the first time did not change its counts.
+
+import numpy as np
+import pandas as pd
+
+from lmia_cube import totals_key
+from lmia_export import to_count
+
+DELTA_KEYS = ['Employer', 'Address', 'NOC_code']
+DELTA_COLUMNS = ['YEAR', 'PERIOD', 'PREVIOUS_YEAR', 'PREVIOUS_PERIOD', 'Change', 'Key',
+                 'Employer', 'Address', 'NOC_code', 'Positions', 'Previous_Positions',
+                 'LMIAs', 'Previous_LMIAs']
+
+
+def delta_keys(df):
+    # 64-bit hash of the normalized Employer / Address / NOC_code of every row
+    normalized = pd.DataFrame({column: pd.Series(totals_key(df[column])).str.strip().str.upper()
+                               for column in DELTA_KEYS})
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def period_totals(df):
+    # Positions and LMIAs of every key of a period (or of a chunk of it),
+    # with the first Employer / Address / NOC_code seen for the key
+    totals = pd.DataFrame({column: totals_key(df[column]) for column in DELTA_KEYS})
+    totals['Key'] = delta_keys(df)
+    totals['Positions'] = to_count(df['Positions']).fillna(0).to_numpy()
+    totals['LMIAs'] = to_count(df['LMIAs']).array
+    return combine_period_totals([totals])
+
+
+def combine_period_totals(parts):
+    # Add up the totals of several chunks of the same period
+    grouped = pd.concat(parts).groupby('Key', sort=False)
+    totals = grouped.agg(Employer=('Employer', 'first'), Address=('Address', 'first'),
+                         NOC_code=('NOC_code', 'first'), Positions=('Positions', 'sum'))
+    # missing when no row of the key has LMIAs
+    totals['LMIAs'] = grouped['LMIAs'].sum(min_count=1)
+    return totals.reset_index()
+
+
+def period_delta(previous, current, period, previous_period):
+    # Delta between the totals of two periods. period / previous_period are (YEAR, PERIOD)
+    merged = current.merge(previous, on='Key', how='outer', suffixes=('', '_previous'), indicator=True)
+    for column in DELTA_KEYS:
+        merged[column] = merged[column].fillna(merged[column + '_previous'])
+    merged['Previous_Positions'] = merged['Positions_previous']
+    merged['Previous_LMIAs'] = merged['LMIAs_previous']
+    # a comparison with missing LMIAs is missing, i.e. not a change
+    changed = ((merged['Positions'] != merged['Previous_Positions']).fillna(False)
+               | (merged['LMIAs'] != merged['Previous_LMIAs']).fillna(False))
+    merged['Change'] = np.select([merged['_merge'] == 'left_only', merged['_merge'] == 'right_only', changed],
+                                 ['new', 'dropped', 'changed'], '')
+    delta = merged[merged['Change'] != ''].copy()
+    delta['YEAR'], delta['PERIOD'] = period
+    delta['PREVIOUS_YEAR'], delta['PREVIOUS_PERIOD'] = previous_period
+    # keys as hexadecimal text, so they survive a round trip through csv
+    delta['Key'] = [format(key, '016x') for key in delta['Key']]
+    for column in ['Positions', 'Previous_Positions', 'LMIAs', 'Previous_LMIAs']:
+        delta[column] = delta[column].astype('Int64')
+    delta = delta.sort_values(['Change', 'Employer', 'Address', 'NOC_code'], kind='stable')
+    return delta[DELTA_COLUMNS]
+
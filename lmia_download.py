@@ -0,0 +1,200 @@
+# Download helpers for the LMIA employer list resources.
+# All the resources are fetched at the same time through one pooled HTTP
+# session, so a run takes as long as the slowest file and not the sum of all
+# the files. When a RawCache is given, cached files are revalidated with
+# conditional requests and only downloaded again when they changed.
+
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# Default number of files downloaded at the same time
+DEFAULT_MAX_WORKERS = 8
+# Default number of processes parsing the files (csv decoding, Excel through openpyxl)
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+
+# encoding of the files are described here: https://open.canada.ca/en/working-data-api/structured-data
+CSV_ENCODING = 'ISO–8859–1'
+
+
+def build_session(max_workers=DEFAULT_MAX_WORKERS):
+    # One session shared by all the download threads.
+    # The connection pool is sized to the number of workers so connections are re-used
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=3)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_resource(session, link, timeout=120, cache=None, offline=False, stats=None, catalog_stamp=None):
+    # Download the raw bytes of a single resource.
+    # In offline mode the bytes come from the cache only.
+    # When the catalog stamp (last modified date & size in the catalog) is the
+    # one of the cached copy, the cached copy is used without any request.
+    # When a stats dictionary is given it receives the status, the bytes
+    # downloaded and the time of the request
+    start = time.perf_counter()
+    if stats is None:
+        stats = {}
+    if offline:
+        if cache is None:
+            raise ValueError('The offline mode needs a cache')
+        content = cache.load(link)
+        stats.update(status='offline', bytes_downloaded=0)
+    elif cache is not None and cache.is_current(link, catalog_stamp):
+        content = cache.load(link)
+        stats.update(status='unchanged in catalog', bytes_downloaded=0)
+    else:
+        headers = cache.conditional_headers(link) if cache is not None else {}
+        response = session.get(link, timeout=timeout, headers=headers)
+        if response.status_code == 304:
+            # Not modified since the last run: use the cached copy.
+            # Without one, the empty body is not the content of the file
+            if cache is None or cache.lookup(link) is None:
+                raise requests.HTTPError('304 Not Modified without a cached copy of ' + link, response=response)
+            content = cache.load(link)
+            cache.set_catalog_stamp(link, catalog_stamp)
+            stats.update(status='not modified', bytes_downloaded=0)
+        else:
+            response.raise_for_status()
+            content = response.content
+            if cache is not None:
+                cache.store(link, content,
+                            etag=response.headers.get('ETag'),
+                            last_modified=response.headers.get('Last-Modified'),
+                            catalog_stamp=catalog_stamp)
+            stats.update(status='downloaded', bytes_downloaded=len(content))
+    stats.update(bytes=len(content), seconds=round(time.perf_counter() - start, 4))
+    return content
+
+
+def fetch_to_cache(session, link, **options):
+    # Download or revalidate a resource into the cache, without keeping its bytes
+    fetch_resource(session, link, **options)
+    return None
+
+
+def download_all(links, max_workers=DEFAULT_MAX_WORKERS, session=None, cache=None, offline=False, stats=None,
+                 catalog_stamps=None, keep_content=True):
+    # Download all the links concurrently and return a dictionary {link: bytes}.
+    # stats (optional dictionary) receives the download stats of every link.
+    # catalog_stamps (optional dictionary) has the catalog stamp of the links.
+    # Without keep_content the files are only downloaded or revalidated into the
+    # cache, and the bytes are None: they are read back with cache.load(link)
+    if not keep_content and cache is None:
+        raise ValueError('Downloading without keeping the content needs a cache')
+    if session is None:
+        session = build_session(max_workers)
+    if stats is None:
+        stats = {}
+    if catalog_stamps is None:
+        catalog_stamps = {}
+    contents = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetch = fetch_resource if keep_content else fetch_to_cache
+        futures = {executor.submit(fetch, session, link, cache=cache, offline=offline,
+                                   stats=stats.setdefault(link, {}),
+                                   catalog_stamp=catalog_stamps.get(link)): link
+                   for link in links}
+        for future in as_completed(futures):
+            link = futures[future]
+            contents[link] = future.result()
+            print(u'✓' + ' Downloaded ' + link.split('/')[-1])
+    return contents
+
+
+def read_resource(content, format, dtype=None, header_row=0, usecols=None, end=None):
+    # Build a DataFrame from the raw bytes, based on the file format.
+    # header_row (rows above the column names), usecols (positions of the columns)
+    # and end (byte offset of the notes of a csv file) come from the sniffer (see lmia_sniff.py)
+    if format == 'csv':
+        if end is not None and end < len(content):
+            content = content[:end]
+        return pd.read_csv(io.BytesIO(content), encoding=CSV_ENCODING, dtype=dtype, skiprows=header_row,
+                           usecols=usecols)
+    elif format == 'xls' or format == 'xlsx':
+        return pd.read_excel(io.BytesIO(content), dtype=dtype, skiprows=header_row, usecols=usecols)
+    return None
+
+
+def read_resources(resources, max_workers=DEFAULT_PARSE_WORKERS, reader=read_resource):
+    # Parse a list of (file_format, bytes, ...) in a pool of processes.
+    # The parsing is CPU-bound, so the files are read in parallel on all the cores.
+    # reader is called with (bytes, file_format, ...) for every resource.
+    # The DataFrames are returned in the same order as the resources
+    arguments = [(content, format) + tuple(extra) for (format, content, *extra) in resources]
+    if max_workers <= 1 or len(resources) <= 1:
+        return [reader(*args) for args in arguments]
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(resources))) as executor:
+        return list(executor.map(reader, *zip(*arguments)))
+
+
+def iter_resource_chunks(content, format, chunksize, header_row=0, usecols=None, end=None):
+    # Read the raw bytes in DataFrames of at most chunksize rows.
+    # The values are kept as they are in the file (text for csv files), so the
+    # type of a column does not depend on the rows that fall in a chunk.
+    # header_row, usecols and end are the options of read_resource
+    if format == 'csv':
+        if end is not None and end < len(content):
+            content = content[:end]
+        yield from pd.read_csv(io.BytesIO(content), encoding=CSV_ENCODING, dtype=str, skiprows=header_row,
+                               usecols=usecols, chunksize=chunksize)
+    elif format == 'xlsx':
+        # openpyxl reads the sheet row by row in read-only mode
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        for _ in range(header_row):
+            next(rows)
+        columns = next(rows)
+        if usecols is not None:
+            columns = [columns[i] for i in usecols]
+        start = 0
+        batch = []
+        for row in rows:
+            if usecols is not None:
+                row = [row[i] if i < len(row) else None for i in usecols]
+            # pandas skips the empty rows as well
+            if all(value is None for value in row):
+                continue
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)))
+                start += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)))
+        workbook.close()
+    elif format == 'xls':
+        # the old Excel format can not be read row by row
+        df = read_resource(content, format, dtype=str, header_row=header_row, usecols=usecols)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def download_resources(names, formats, links, max_workers=DEFAULT_MAX_WORKERS, session=None,
+                       cache=None, offline=False, stats=None, catalog_stamps=None, keep_content=True):
+    # Download every csv/xls/xlsx resource at the same time and return the raw
+    # bytes as a dictionary {file_name: (file_format, bytes)} in the order of the links.
+    # stats (optional dictionary) receives the download stats {file_name: {...}}
+    # catalog_stamps (optional list, in the order of the links) skips the files unchanged in the catalog.
+    # Without keep_content the bytes are None and stay in the cache (see download_all)
+    resources = [(name, format, link) for (name, format, link) in zip(names, formats, links)
+                 if format in ('csv', 'xls', 'xlsx')]
+    print('-----Downloading ' + str(len(resources)) + ' files with up to '
+          + str(max_workers) + ' at the same time')
+    link_stats = {}
+    stamps = dict(zip(links, catalog_stamps)) if catalog_stamps is not None else None
+    contents = download_all([link for (_, _, link) in resources], max_workers, session,
+                            cache=cache, offline=offline, stats=link_stats, catalog_stamps=stamps,
+                            keep_content=keep_content)
+    if stats is not None:
+        for (name, _, link) in resources:
+            stats[name] = link_stats[link]
+    return {name: (format, contents[link]) for (name, format, link) in resources}
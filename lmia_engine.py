@@ -0,0 +1,345 @@
+# Engines running the period transforms and the NOC split.
+#   - PandasEngine (default): the process_* functions of lmia_transform.py on
+#     whole DataFrames, the files parsed in a pool of processes
+#   - DuckDBEngine: the same cleaning rules (fill down, LAYOUT_FILTERS of
+#     lmia_filters.py, renames) as multi-threaded SQL, out-of-core: the tables
+#     spill to disk past the memory limit. The csv files are read by DuckDB and
+#     the Excel files are appended in batches of rows (openpyxl reads xlsx row
+#     by row). The processed periods stay in DuckDB tables through the merge
+#     with the existing master file and the NOC split. Only the distinct
+#     addresses and employer records are parsed and matched in pandas, and the
+#     rows come back one period at a time for the exports, so the memory is
+#     bounded by the largest period. Needs `pip install duckdb`
+# Both engines give the same rows, so the exported files are byte-identical
+# (see check_engine_parity.py).
+#
+# An engine has 3 methods:
+#   read(resources)           -> (layout, raw object) of every resource, resources is a list of
+#                                (file_format, bytes, registered layout or None). The layout
+#                                comes from the header of the file (see lmia_sniff.py)
+#   process(raw, layout)      -> DataFrame of the data rows of a raw object
+#   split_noc(df)             -> df with the NOC_code and NOC_label columns
+# and rows(raw), the number of rows of a raw object.
+# out_of_core tells how the pipeline runs with the engine. An in-memory engine
+# (pandas) hands its processed DataFrames to the merge with the master file in
+# pandas (lmia_manifest.py). An out-of-core engine (DuckDB) keeps the whole
+# pipeline in its tables and hands back the rows one period at a time:
+#   process_table(raw, layout) -> table of the data rows of a raw table
+#   merge(tables, periods, master_path) -> master table of every period, with the NOC split
+#   distinct(columns)          -> DataFrame of the distinct values of columns in the master table
+#   join(frame, keys)          -> add the columns of a DataFrame of distinct keys to the master table
+#   periods()                  -> ((YEAR, PERIOD), DataFrame) of every period of the master table
+
+import os
+import tempfile
+
+import pandas as pd
+
+from lmia_download import DEFAULT_PARSE_WORKERS, iter_resource_chunks, read_resources
+from lmia_filters import LAYOUT_FILTERS, NOTE_PATTERN
+from lmia_sniff import read_sniffed, sniff
+from lmia_transform import (NOC_PATTERN, process_2014_2015, process_2016, process_2017_q1_to_2021_q3,
+                            process_2021_q4_to_2024_q1, split_noc)
+
+ENGINES = ['pandas', 'duckdb']
+
+PROCESSORS = {
+    '2014_2015': process_2014_2015,
+    '2016': process_2016,
+    '2017_q1_to_2021_q3': process_2017_q1_to_2021_q3,
+    '2021_q4_to_2024_q1': process_2021_q4_to_2024_q1,
+}
+LAYOUTS = {process: layout for layout, process in PROCESSORS.items()}
+
+# Cells read as missing values by DuckDB: the default NA values of pandas.read_csv,
+# so both engines read the same cells as missing
+CSV_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                 '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Raw columns of every layout, in the order of the file, and the columns that are filled down
+RAW_COLUMNS = {
+    '2014_2015': ['Employer_raw', 'Address_raw', 'Positions_raw'],
+    '2016': ['Province_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Positions_raw'],
+    '2017_q1_to_2021_q3': ['Province_raw', 'Stream_raw', 'Employer_raw', 'Address_raw', 'NOC_raw',
+                           'Positions_raw'],
+    '2021_q4_to_2024_q1': ['Province_raw', 'Stream_raw', 'Employer_raw', 'Address_raw', 'NOC_raw',
+                           'Incorporate_status_raw', 'LMIAs_raw', 'Positions_raw'],
+}
+FILL_COLUMNS = {
+    '2014_2015': ['Province_raw'],
+    '2016': ['Province_raw'],
+    '2017_q1_to_2021_q3': ['Stream_raw', 'Province_raw'],
+    '2021_q4_to_2024_q1': [],
+}
+# Columns of the processed rows, in the order of the process_* functions
+OUTPUT_COLUMNS = {
+    '2014_2015': ['Employer', 'Address', 'Positions', 'Province', 'NOC', 'Stream', 'Incorporate_status', 'LMIAs'],
+    '2016': ['Province', 'Employer', 'Address', 'NOC', 'Positions', 'Stream', 'Incorporate_status', 'LMIAs'],
+    '2017_q1_to_2021_q3': ['Province', 'Stream', 'Employer', 'Address', 'NOC', 'Positions',
+                           'Incorporate_status', 'LMIAs'],
+    '2021_q4_to_2024_q1': ['Province', 'Stream', 'Employer', 'Address', 'NOC', 'Incorporate_status',
+                           'LMIAs', 'Positions'],
+}
+# Columns of the processed rows in the master table, before YEAR and PERIOD
+MERGED_COLUMNS = ['Employer', 'Address', 'Positions', 'Province', 'NOC', 'Stream', 'Incorporate_status', 'LMIAs']
+# Rows of an Excel file appended to its table at once
+EXCEL_BATCH_ROWS = 50000
+# Folder of the tables spilled to disk by DuckDB
+DEFAULT_TEMP_DIRECTORY = os.path.join(tempfile.gettempdir(), 'lmia_duckdb')
+
+
+def get_engine(name, parse_workers=DEFAULT_PARSE_WORKERS, memory_limit=None):
+    if name == 'pandas':
+        return PandasEngine(parse_workers)
+    if name == 'duckdb':
+        return DuckDBEngine(threads=parse_workers, memory_limit=memory_limit)
+    raise ValueError('Unknown engine: ' + str(name))
+
+
+class PandasEngine:
+
+    name = 'pandas'
+    out_of_core = False
+
+    def __init__(self, parse_workers=DEFAULT_PARSE_WORKERS):
+        self.parse_workers = parse_workers
+
+    def read(self, resources):
+        return read_resources(resources, self.parse_workers, reader=read_sniffed)
+
+    def rows(self, raw):
+        return len(raw)
+
+    def process(self, raw, layout):
+        return PROCESSORS[layout](raw)
+
+    def split_noc(self, df):
+        return split_noc(df)
+
+
+###############################################################################
+# DuckDB engine.
+# The raw values are kept as text, like the pandas engine reads them.
+
+def sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def sql_list(values):
+    return '(' + ', '.join(sql_string(value) for value in values) + ')'
+
+
+def filter_sql(rules):
+    # The rules of a layout (see lmia_filters.py) as a WHERE condition
+    conditions = ['TRUE']
+    if rules.get('note_column'):
+        pattern = rules.get('note_pattern', NOTE_PATTERN)
+        conditions.append(f"NOT coalesce(regexp_matches({rules['note_column']}, {sql_string(pattern)}), FALSE)")
+    for column in rules.get('required_columns', []):
+        conditions.append(f'{column} IS NOT NULL')
+    for column, values in rules.get('header_values', {}).items():
+        conditions.append(f'NOT coalesce({column} IN {sql_list(values)}, FALSE)')
+    condition = ' AND '.join(conditions)
+    keep = [f'coalesce({column} IN {sql_list(values)}, FALSE)'
+            for column, values in rules.get('keep_values', {}).items()]
+    if keep:
+        condition = f'({condition}) OR ' + ' OR '.join(keep)
+    return condition
+
+
+def cell_text(value):
+    # A cell as the text pandas.read_excel gives with dtype=str (None when missing):
+    # the whole numbers without decimals and the default NA values as missing
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value)
+    return None if text in CSV_NA_VALUES else text
+
+
+def text_frame(df, columns):
+    # The first columns of a parsed DataFrame as text columns c0, c1... with its row number
+    frame = pd.DataFrame({f'c{i}': df.iloc[:, i].astype(object).map(cell_text).astype(object)
+                          for i in range(columns)})
+    frame.insert(0, 'rn', df.index.to_numpy())
+    return frame
+
+
+class DuckDBEngine:
+
+    name = 'duckdb'
+    out_of_core = True
+
+    def __init__(self, threads=None, memory_limit=None, temp_directory=None):
+        import duckdb
+        config = {}
+        if threads:
+            config['threads'] = threads
+        if memory_limit:
+            config['memory_limit'] = memory_limit
+        config['temp_directory'] = temp_directory or DEFAULT_TEMP_DIRECTORY
+        self.conn = duckdb.connect(config=config)
+        self.tables = 0
+
+    def read(self, resources):
+        return [self.read_one(format, content, layout) for (format, content, layout) in resources]
+
+    def read_one(self, format, content, layout=None):
+        # Load a raw file into a table of text columns c0, c1... with its row number
+        layout, options = sniff(content, format, layout)
+        if layout is None:
+            return None, None
+        self.tables += 1
+        table = f'raw_{self.tables}'
+        if format == 'csv':
+            self.read_csv(table, content, **options)
+        else:
+            self.read_excel(table, content, format, len(RAW_COLUMNS[layout]), **options)
+        return layout, table
+
+    def read_excel(self, table, content, format, columns, **options):
+        # No Excel reader in DuckDB without an extension: the rows are appended in
+        # batches, so the whole sheet is never a DataFrame (except for .xls files)
+        names = ', '.join(f'c{i} VARCHAR' for i in range(columns))
+        self.conn.execute(f'CREATE TABLE {table} (rn BIGINT, {names})')
+        for chunk in iter_resource_chunks(content, format, EXCEL_BATCH_ROWS, **options):
+            self.conn.register('frame', text_frame(chunk, columns))
+            self.conn.execute(f'INSERT INTO {table} SELECT * FROM frame')
+            self.conn.unregister('frame')
+
+    def read_csv(self, table, content, header_row=0, usecols=None, end=None):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                # the notes at the bottom of the file are not loaded
+                f.write(memoryview(content)[:end])
+            source = (f"read_csv({sql_string(path)}, header=true, skip={header_row}, all_varchar=true, "
+                      f"encoding='latin-1', nullstr={CSV_NA_VALUES})")
+            names = [row[0] for row in self.conn.execute(f'DESCRIBE SELECT * FROM {source}').fetchall()]
+            if usecols is not None:
+                names = [names[i] for i in usecols]
+            self.conn.execute(f'CREATE TABLE {table} AS SELECT row_number() OVER () - 1 AS rn, '
+                              + ', '.join(f'"{name}" AS c{i}' for i, name in enumerate(names)) + f' FROM {source}')
+        finally:
+            os.remove(path)
+
+    def rows(self, raw):
+        return self.conn.execute(f'SELECT count(*) FROM {raw}').fetchone()[0]
+
+    def process(self, raw, layout):
+        table = self.process_table(raw, layout)
+        df = self.conn.execute(f'SELECT * FROM {table} ORDER BY rn').df().set_index('rn')
+        df.index.name = None
+        self.conn.execute(f'DROP TABLE {table}')
+        return df.astype(object).where(df.notna(), None)
+
+    def process_table(self, raw, layout):
+        # Fill down, filter and rename the columns of a raw table, like the process_* functions.
+        # The rows go to a new table and the raw table is dropped
+        raw_columns = RAW_COLUMNS[layout]
+        named = ', '.join(f'c{i} AS {column}' for i, column in enumerate(raw_columns))
+        sql = f'WITH named AS (SELECT rn, {named} FROM {raw})'
+        available = list(raw_columns)
+        if layout == '2014_2015':
+            # the province is on its own row on top of its employers
+            sql += (', nested AS (SELECT *, CASE WHEN Address_raw IS NULL THEN Employer_raw END AS Province_raw'
+                    ' FROM named)')
+            source = 'nested'
+            available.append('Province_raw')
+        else:
+            source = 'named'
+        fills = FILL_COLUMNS[layout]
+        if fills:
+            replace = ', '.join(f'last_value({column} IGNORE NULLS) OVER (ORDER BY rn ROWS BETWEEN '
+                                f'UNBOUNDED PRECEDING AND CURRENT ROW) AS {column}' for column in fills)
+            sql += f', filled AS (SELECT * REPLACE ({replace}) FROM {source})'
+            source = 'filled'
+        output = []
+        for column in OUTPUT_COLUMNS[layout]:
+            if column + '_raw' in available:
+                output.append(f'{column}_raw AS "{column}"')
+            else:
+                output.append(f'CAST(NULL AS VARCHAR) AS "{column}"')
+        sql += (f' SELECT rn, {", ".join(output)} FROM {source}'
+                f' WHERE {filter_sql(LAYOUT_FILTERS[layout])} ORDER BY rn')
+        self.tables += 1
+        table = f'processed_{self.tables}'
+        self.conn.execute(f'CREATE TABLE {table} AS {sql}')
+        self.conn.execute(f'DROP TABLE {raw}')
+        return table
+
+    def split_noc(self, df):
+        # the NOC column is empty for the 2014 & 2015 files
+        noc = df['NOC'].astype(object)
+        self.conn.register('noc', pd.DataFrame({'NOC': noc.where(noc.notna(), None).to_numpy()}))
+        code = f'nullif(regexp_extract(NOC, {sql_string(NOC_PATTERN)}, 1), \'\')'
+        result = self.conn.execute(f'SELECT {code} AS NOC_code, CASE WHEN {code} IS NULL THEN NOC ELSE '
+                                   f'regexp_extract(NOC, {sql_string(NOC_PATTERN)}, 2) END AS NOC_label FROM noc').df()
+        self.conn.unregister('noc')
+        df['NOC_code'] = result['NOC_code'].to_numpy()
+        df['NOC_label'] = result['NOC_label'].to_numpy()
+        return(df)
+
+    def merge(self, tables, periods, master_path):
+        # The master table: the rows of every (YEAR, PERIOD) of periods in their order, from
+        # its processed table (tables is {(YEAR, PERIOD): table}) or else from the existing
+        # master file, read as text like merge_into_master (lmia_manifest.py). The NOC is
+        # split with SQL and the Employer_id of the existing rows is kept as old_Employer_id.
+        # Returns the number of rows
+        self.conn.execute('CREATE OR REPLACE TABLE periods (pos BIGINT, "YEAR" VARCHAR, "PERIOD" VARCHAR)')
+        self.conn.executemany('INSERT INTO periods VALUES (?, ?, ?)',
+                              [(pos, str(year), str(period)) for pos, (year, period) in enumerate(periods)])
+        columns = [f'"{column}"' for column in MERGED_COLUMNS]
+        parts = [f'SELECT {pos} AS pos, rn, CAST(rn AS VARCHAR) AS idx, {", ".join(columns)}, '
+                 f'CAST(NULL AS VARCHAR) AS old_Employer_id FROM {tables[key]}'
+                 for pos, key in enumerate(periods) if key in tables]
+        kept = [str(pos) for pos, key in enumerate(periods) if key not in tables]
+        if kept and os.path.exists(master_path):
+            # only the empty cells are missing values, so a name such as "NA" stays as it is
+            source = (f"read_csv({sql_string(master_path)}, header=true, all_varchar=true, nullstr='', "
+                      "delim=',', quote='\"', escape='\"')")
+            names = [row[0] for row in self.conn.execute(f'DESCRIBE SELECT * FROM {source}').fetchall()]
+            existing = ', '.join(f'"{column}"' if column in names else f'CAST(NULL AS VARCHAR) AS "{column}"'
+                                 for column in MERGED_COLUMNS + ['YEAR', 'PERIOD', 'Employer_id'])
+            self.conn.execute(f'CREATE TABLE existing AS SELECT row_number() OVER () - 1 AS rn, '
+                              f'"{names[0]}" AS idx, {existing} FROM {source}')
+            # the empty PERIOD of the 2014 - 2016 files is a key like the others
+            parts.append(f'SELECT p.pos, e.rn, e.idx, {", ".join("e." + column for column in columns)}, '
+                         'e."Employer_id" AS old_Employer_id FROM existing e JOIN periods p '
+                         'ON e."YEAR" = p."YEAR" AND coalesce(e."PERIOD", \'\') = p."PERIOD" '
+                         f'WHERE p.pos IN ({", ".join(kept)})')
+        code = f"nullif(regexp_extract(NOC, {sql_string(NOC_PATTERN)}, 1), '')"
+        label = f'CASE WHEN {code} IS NULL THEN NOC ELSE regexp_extract(NOC, {sql_string(NOC_PATTERN)}, 2) END'
+        self.conn.execute('CREATE TABLE master AS SELECT row_number() OVER (ORDER BY u.pos, u.rn) AS "row", '
+                          f'u.pos, u.idx, {", ".join("u." + column for column in columns)}, p."YEAR", p."PERIOD", '
+                          f'{code} AS NOC_code, {label} AS NOC_label, u.old_Employer_id '
+                          f'FROM ({" UNION ALL ".join(parts)}) u JOIN periods p USING (pos) ORDER BY "row"')
+        for table in list(tables.values()) + ['existing']:
+            self.conn.execute(f'DROP TABLE IF EXISTS {table}')
+        return self.rows('master')
+
+    def distinct(self, columns):
+        # The distinct values of columns in the master table, in the order they first appear
+        names = ', '.join(f'"{column}"' for column in columns)
+        df = self.conn.execute(f'SELECT {names} FROM master GROUP BY ALL ORDER BY min("row")').df()
+        return df.astype(object).where(df.notna(), None)
+
+    def join(self, frame, keys):
+        # Add the other columns of frame (one row per distinct keys) to the rows of the master table
+        self.conn.register('lookup', frame)
+        on = ' AND '.join(f'm."{key}" IS NOT DISTINCT FROM l."{key}"' for key in keys)
+        added = ', '.join(f'l."{column}"' for column in frame.columns if column not in keys)
+        self.conn.execute(f'CREATE OR REPLACE TABLE master AS SELECT m.*, {added} FROM master m '
+                          f'LEFT JOIN lookup l ON {on} ORDER BY m."row"')
+        self.conn.unregister('lookup')
+
+    def periods(self):
+        # ((YEAR, PERIOD), DataFrame of its rows) of every period of the master table with rows,
+        # in order. The index of the rows is their row number in the source file
+        keys = self.conn.execute('SELECT DISTINCT pos, "YEAR", "PERIOD" FROM master ORDER BY pos').fetchall()
+        for pos, year, period in keys:
+            df = self.conn.execute('SELECT * EXCLUDE ("row", pos) FROM master WHERE pos = ? ORDER BY "row"',
+                                   [pos]).df().set_index('idx')
+            df.index.name = None
+            yield (year, period), df.astype(object).where(df.notna(), None)
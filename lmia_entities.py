@@ -0,0 +1,212 @@
+# Employer name normalization and entity resolution.
+# The employer names are entered manually in the source system, so the same
+# employer shows up under many spellings across quarters, e.g.
+# "2775666  ONTARIO INC." and "2775666 Ontario Inc".
+# Every row of the master DataFrame gets an Employer_id:
+#   1. names are normalized with vectorized string operations
+#   2. the distinct (name, postal code) records are grouped in small blocks
+#      (same normalized name & province, same postal code) and only the
+#      records of a block are compared with each other (and only when their
+#      names have the same numbers), so the matching grows
+#      close to linearly with the number of rows instead of comparing every pair
+#   3. the matched records are merged (union-find) and each group gets an id.
+#      A group keeps the oldest id already given to one of its records (the
+#      {record: Employer_id} map of the last run is saved next to the
+#      manifest), so the rows of the old quarters keep their Employer_id when
+#      a new quarter merges two groups. A new group gets the hash of its
+#      smallest record
+
+import hashlib
+import os
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+# Legal form words dropped at the end of the names
+LEGAL_SUFFIXES = ['INC', 'INCORPORATED', 'INCORPOREE', 'LTD', 'LTEE', 'LIMITED', 'CORP', 'CORPORATION',
+                  'CO', 'COMPANY', 'LLC', 'LLP', 'LP', 'ULC', 'SENC', 'SENCRL']
+
+# Canadian postal code (e.g. L6S 6B5) and province code (e.g. ON) in the Address
+POSTAL_CODE_PATTERN = r'([A-Z]\d[A-Z])\s*(\d[A-Z]\d)'
+PROVINCE_CODE_PATTERN = r',\s*(AB|BC|MB|NB|NL|NS|NT|NU|ON|PE|QC|SK|YT)\b'
+
+# Two names of the same block are the same employer above this similarity
+MATCH_THRESHOLD = 0.92
+# The fuzzy comparison is skipped in bigger blocks (exact matches only)
+MAX_BLOCK_SIZE = 200
+
+
+def map_distinct(values, function):
+    # Apply a vectorized string function to the distinct values only, then map
+    # the results back to every row. The same names and addresses come back
+    # every quarter, so there are far fewer distinct values than rows
+    codes, uniques = pd.factorize(values.astype(object).fillna('').astype(str))
+    results = function(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(results[codes], index=values.index)
+
+
+def normalize_names(names):
+    # Upper case ASCII names without punctuation, extra spaces or legal form
+    suffixes = r'(\s(' + '|'.join(LEGAL_SUFFIXES) + r'))+$'
+    return map_distinct(names, lambda distinct: (
+        distinct.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+        .str.upper()
+        .str.replace('&', ' AND ', regex=False)
+        .str.replace(r'[^A-Z0-9 ]', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+        .str.replace(suffixes, '', regex=True)))
+
+
+def extract_postal_codes(addresses):
+    # "Brampton, ON L6S 6B5" -> "L6S6B5"
+    def extract(distinct):
+        parts = distinct.str.upper().str.extract(POSTAL_CODE_PATTERN)
+        return (parts[0] + parts[1]).fillna('')
+    return map_distinct(addresses, extract)
+
+
+def extract_province_codes(addresses):
+    # "Brampton, ON L6S 6B5" -> "ON"
+    return map_distinct(addresses, lambda distinct: (
+        distinct.str.upper().str.extract(PROVINCE_CODE_PATTERN)[0].fillna('')))
+
+
+class UnionFind:
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def digit_runs(name):
+    # "2775666 ONTARIO" -> ['2775666']
+    return re.findall(r'\d+', name)
+
+
+def similar(a, b):
+    # Names with different numbers are different employers, however close the
+    # spelling (e.g. the numbered companies 2775666 and 2775667 Ontario Inc.
+    # registered at the same accountant's address)
+    if digit_runs(a) != digit_runs(b):
+        return False
+    matcher = SequenceMatcher(None, a, b)
+    return (matcher.real_quick_ratio() >= MATCH_THRESHOLD
+            and matcher.quick_ratio() >= MATCH_THRESHOLD
+            and matcher.ratio() >= MATCH_THRESHOLD)
+
+
+def resolve_records(records):
+    # records: DataFrame of distinct (name, postal, province) with a RangeIndex.
+    # Returns the group number of every record
+
+    # block 1: the same normalized name in the same province is the same employer
+    name_groups = records.groupby(['name', 'province'], sort=False).ngroup().to_numpy()
+    groups = UnionFind(int(name_groups.max()) + 1 if len(records) else 0)
+
+    # block 2: same postal code. Only the names of a block are compared with each other
+    candidates = records.loc[records['postal'] != '', ['postal', 'name']]
+    candidates = candidates.assign(group=name_groups[candidates.index.to_numpy()])
+    sizes = candidates.groupby('postal')['name'].transform('size')
+    candidates = candidates[(sizes >= 2) & (sizes <= MAX_BLOCK_SIZE)].sort_values('postal')
+    postal = candidates['postal'].to_numpy()
+    names = candidates['name'].to_numpy()
+    name_group = candidates['group'].to_numpy()
+    boundaries = np.flatnonzero(postal[1:] != postal[:-1]) + 1
+    for block in np.split(np.arange(len(candidates)), boundaries):
+        for position, i in enumerate(block):
+            for j in block[position + 1:]:
+                if (names[i] and names[j] and groups.find(name_group[i]) != groups.find(name_group[j])
+                        and similar(names[i], names[j])):
+                    groups.union(name_group[i], name_group[j])
+
+    return [groups.find(group) for group in name_groups]
+
+
+def employer_id(key):
+    return 'E' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+
+def group_ids(records, known_ids=None):
+    # Employer_id of every group of the records (Series indexed by group)
+    smallest = records.sort_values('key').drop_duplicates('group').set_index('group')['key']
+    ids = smallest.map(employer_id)
+    if not known_ids:
+        return ids
+    age = {key: number for number, key in enumerate(known_ids)}
+    known = records.assign(id=records['key'].map(known_ids), age=records['key'].map(age)).dropna(subset=['id'])
+    # the oldest id of every group
+    oldest = known.sort_values('age', kind='stable').drop_duplicates('group')
+    # when the records of an id are now in several groups, the id stays with the group
+    # that has the most of them (then the group of the smallest record)
+    votes = known.groupby(['group', 'id']).size().rename('votes').reset_index()
+    oldest = oldest[['group', 'id']].merge(votes, on=['group', 'id'])
+    oldest['smallest'] = oldest['group'].map(smallest).to_numpy()
+    oldest = oldest.sort_values(['votes', 'smallest'], ascending=[False, True]).drop_duplicates('id')
+    ids.loc[oldest['group'].to_numpy()] = oldest['id'].to_numpy()
+    # the new groups do not take an id that is kept
+    kept = set(oldest['id'])
+    new_groups = ids.index.difference(oldest['group'])
+    for group in new_groups[ids.loc[new_groups].isin(kept).to_numpy()]:
+        key = smallest.loc[group]
+        while ids.loc[group] in kept:
+            key += '|'
+            ids.loc[group] = employer_id(key)
+    return ids
+
+
+def resolve_employer_ids(df, known_ids=None):
+    # Employer_id of every row of df (same index as df) and the {record: Employer_id}
+    # map to keep for the next run. known_ids is the map of the last run, oldest records first
+    rows = pd.DataFrame({'name': normalize_names(df['Employer']).to_numpy(),
+                         'postal': extract_postal_codes(df['Address']).to_numpy(),
+                         'province': extract_province_codes(df['Address']).to_numpy()})
+    # match the distinct records only. record_numbers points every row to its record
+    record_numbers = rows.groupby(['name', 'postal', 'province'], sort=False).ngroup().to_numpy()
+    records = rows.drop_duplicates().reset_index(drop=True)
+    records['group'] = resolve_records(records)
+    records['key'] = records['name'] + '|' + records['postal'] + '|' + records['province']
+    record_ids = records['group'].map(group_ids(records, known_ids)).to_numpy()
+
+    # the records of the last run keep their place in the map, the new ones are added at the end
+    current = dict(zip(records['key'], record_ids))
+    id_map = {key: current[key] for key in (known_ids or {}) if key in current}
+    id_map.update((key, current[key]) for key in sorted(current) if key not in id_map)
+    return pd.Series(record_ids[record_numbers], index=df.index, name='Employer_id'), id_map
+
+
+def assign_employer_ids(df, known_ids=None):
+    # Return the Employer_id of every row of df (same index as df)
+    return resolve_employer_ids(df, known_ids)[0]
+
+
+def changed_ids(old_ids, new_ids):
+    # Rows whose Employer_id changed, or had none (a master file written by --stream)
+    old_ids = old_ids.astype(object)
+    return (old_ids.isna() | (old_ids != np.asarray(new_ids, dtype=object))).to_numpy()
+
+
+def load_employer_ids(path):
+    # {record: Employer_id} map of the last run, in the order the records were first seen
+    if not os.path.exists(path):
+        return {}
+    ids = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return dict(zip(ids['Record'], ids['Employer_id']))
+
+
+def save_employer_ids(path, id_map):
+    pd.DataFrame({'Record': list(id_map), 'Employer_id': list(id_map.values())}).to_csv(path, index=False)
@@ -0,0 +1,297 @@
+# Export helpers of the master DataFrame.
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from lmia_offsets import offset_columns, run_starts
+from lmia_transform import MASTER_COLUMNS
+
+# Parquet dataset partitioned by YEAR / PERIOD
+DEFAULT_PARQUET = 'Employer_list_positive_LMIA_Canada_parquet'
+# Columns of the Parquet export
+PARQUET_PARTITION_COLUMNS = ['YEAR', 'PERIOD']
+# dictionary-encoded columns (few distinct values repeated on every row)
+PARQUET_CATEGORY_COLUMNS = ['Province', 'Stream', 'Incorporate_status', 'NOC_code', 'PERIOD', 'Province_code', 'FSA']
+# numeric columns
+PARQUET_COUNT_COLUMNS = ['Positions', 'LMIAs']
+
+
+# Split the dataframe into smaller chunks and export each chunk to csv
+def split_and_export_csv(df, rows_per_file, base_filename):
+    # Calculate the number of files needed
+    num_files = (len(df) // rows_per_file) + (1 if len(df) % rows_per_file != 0 else 0)
+    # Loop and save each subset
+    for i in range(num_files):
+        start_row = i * rows_per_file
+        end_row = (i + 1) * rows_per_file
+        chunk = df.iloc[start_row:end_row]
+        print('Started the export of ' + f'{base_filename}_{i+1}.csv')
+        chunk.to_csv(f'{base_filename}_{i+1}.csv')
+        print(f'Exported {base_filename}_{i+1}.csv' + '\n')
+
+
+class ChunkedCsvExport:
+    # Write the master csv file and its numbered splits in a single pass.
+    # Every chunk is serialized once and the same text goes to the master file
+    # and to the current split, so the whole master DataFrame never has to be
+    # in memory. The splits are aligned on the periods: a new split starts at
+    # the start of a period once the current one holds rows_per_file rows, so a
+    # new quarter does not shift the rows of the files before it. A split is
+    # also cut inside a (very large) period at max_rows_per_file rows.
+    # The files are written to temporary files and their sha256 is compared
+    # with the chunk index of the last run (<base_filename>_chunks.json): a
+    # file is only replaced when its content changed.
+    # The byte ranges of the rows of every YEAR / PERIOD / Province in each file
+    # are written to <base_filename>_offsets.json (see lmia_offsets.py).
+
+    def __init__(self, master_path, base_filename, rows_per_file, columns, compression=None,
+                 max_rows_per_file=None):
+        self.extension = '.gz' if compression == 'gzip' else ''
+        self.master_path = master_path + self.extension
+        self.base_filename = base_filename
+        self.rows_per_file = rows_per_file
+        self.max_rows_per_file = max_rows_per_file or 2 * rows_per_file
+        self.columns = columns
+        self.compression = compression
+        self.index_path = base_filename + '_chunks.json'
+        self.offsets_path = base_filename + '_offsets.json'
+        self.offsets = {}
+        self.rows_written = 0
+        self.files = {}
+        self.master_file = self.open_file(self.master_path)
+        self.split_file = None
+        self.split_number = 0
+        self.split_rows = 0
+
+    def open_file(self, path):
+        # temporary file, its hash, its number of rows and its number of bytes (uncompressed)
+        if self.compression == 'gzip':
+            # no timestamp in the header, so the same rows give the same bytes
+            f = gzip.GzipFile(path + '.tmp', 'wb', mtime=0)
+        else:
+            f = open(path + '.tmp', 'wb')
+        self.files[path] = [f, hashlib.sha256(), 0, 0]
+        self.offsets[path] = {'compression': self.compression, 'ranges': []}
+        self.write_data(path, (',' + ','.join(self.columns) + '\n').encode('utf-8'), [])
+        self.offsets[path]['header'] = self.files[path][3]
+        return path
+
+    def write_data(self, path, data, runs):
+        # runs are the [YEAR, PERIOD, Province, start, end, rows] of the data, from its first byte
+        entry = self.files[path]
+        ranges = self.offsets[path]['ranges']
+        for (year, period, province, start, end, rows) in runs:
+            start += entry[3]
+            end += entry[3]
+            if ranges and ranges[-1][:3] == [year, period, province] and ranges[-1][4] == start:
+                # the run goes on from the previous chunk
+                ranges[-1][4] = end
+                ranges[-1][5] += rows
+            else:
+                ranges.append([year, period, province, start, end, rows])
+            entry[2] += rows
+        entry[0].write(data)
+        entry[1].update(data)
+        entry[3] += len(data)
+
+    def start_period(self):
+        # Called before the first chunk of every period (YEAR / PERIOD)
+        if self.split_file is not None and self.split_rows >= self.rows_per_file:
+            self.next_split()
+
+    def write(self, chunk):
+        chunk = chunk.reindex(columns=self.columns)
+        start = 0
+        while start < len(chunk):
+            if self.split_file is None or self.split_rows == self.max_rows_per_file:
+                self.next_split()
+            end = start + self.max_rows_per_file - self.split_rows
+            part = chunk.iloc[start:end]
+            data, runs = self.serialize(part)
+            self.write_data(self.master_file, data, runs)
+            self.write_data(self.split_file, data, runs)
+            self.split_rows += len(part)
+            start = end
+        self.rows_written += len(chunk)
+
+    def serialize(self, part):
+        # csv bytes of the rows and the runs of rows with the same YEAR / PERIOD / Province
+        columns = offset_columns(part)
+        starts = run_starts(columns)
+        data = part.to_csv(header=False, lineterminator='\n').encode('utf-8')
+        row_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1
+        if len(row_ends) == len(part):
+            bounds = np.concatenate([[0], row_ends])[starts]
+        else:
+            # a value spans several lines: every run is serialized on its own
+            pieces = [part.iloc[start:end].to_csv(header=False, lineterminator='\n').encode('utf-8')
+                      for start, end in zip(starts[:-1], starts[1:])]
+            data = b''.join(pieces)
+            bounds = np.cumsum([0] + [len(piece) for piece in pieces])
+        runs = [[columns[0][start], columns[1][start], columns[2][start], int(bounds[number]),
+                 int(bounds[number + 1]), end - start]
+                for number, (start, end) in enumerate(zip(starts[:-1], starts[1:]))]
+        return data, runs
+
+    def next_split(self):
+        self.split_number += 1
+        self.split_rows = 0
+        self.split_file = self.open_file(f'{self.base_filename}_{self.split_number}.csv{self.extension}')
+
+    def close(self):
+        # Replace the files whose content changed and remove the numbered splits on disk
+        # that are not produced anymore (also the ones of an older layout without a
+        # chunk index). Returns the paths of the files written
+        previous = load_chunk_index(self.index_path)
+        index = {}
+        written = []
+        for path, (f, content_hash, rows, size) in self.files.items():
+            f.close()
+            entry = {'sha256': content_hash.hexdigest(), 'rows': rows, 'compression': self.compression}
+            old_entry = previous.get(path)
+            if (old_entry is not None and os.path.exists(path)
+                    and {key: old_entry.get(key) for key in entry} == entry
+                    and os.path.getsize(path) == old_entry.get('bytes')):
+                os.remove(path + '.tmp')
+                print('Unchanged ' + path)
+            else:
+                os.replace(path + '.tmp', path)
+                written.append(path)
+                print('Exported ' + path + '\n')
+            entry['bytes'] = os.path.getsize(path)
+            index[path] = entry
+            self.offsets[path]['bytes'] = size
+        for path in split_paths(self.base_filename):
+            if path not in index and path != self.master_path:
+                os.remove(path)
+                print('Removed ' + path)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+            f.write('\n')
+        with open(self.offsets_path, 'w', encoding='utf-8') as f:
+            json.dump(self.offsets, f)
+            f.write('\n')
+        print('Exported ' + self.offsets_path)
+        return written
+
+
+def split_paths(base_filename):
+    # The numbered splits of a base file name on disk: <base_filename>_1.csv, ..._2.csv.gz
+    pattern = re.compile(re.escape(os.path.basename(base_filename)) + r'_[0-9]+\.csv(\.gz)?$')
+    return sorted(path for path in glob.glob(glob.escape(base_filename) + '_*.csv*')
+                  if pattern.match(os.path.basename(path)))
+
+
+def load_chunk_index(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def period_runs(df):
+    # ((YEAR, PERIOD), rows) of every run of rows with the same YEAR / PERIOD, in order.
+    # The empty PERIOD of the 2014 - 2016 files is ''
+    if not len(df):
+        return
+    years = df['YEAR'].astype(object).fillna('').astype(str).to_numpy()
+    periods = df['PERIOD'].astype(object).fillna('').astype(str).to_numpy()
+    keys = (pd.Series(years) + '/' + pd.Series(periods)).to_numpy()
+    # start of each run of rows with the same YEAR / PERIOD
+    starts = [0] + list(np.flatnonzero(keys[1:] != keys[:-1]) + 1) + [len(df)]
+    for start, end in zip(starts[:-1], starts[1:]):
+        yield (years[start], periods[start]), df.iloc[start:end]
+
+
+def export_csv(df, master_path, base_filename, rows_per_file, columns, compression=None):
+    # Write the master csv file and its splits from a DataFrame, one period at a time.
+    # Returns the paths of the files written
+    export = ChunkedCsvExport(master_path, base_filename, rows_per_file, columns, compression)
+    for _, rows in period_runs(df):
+        export.start_period()
+        export.write(rows)
+    return export.close()
+
+
+###############################################################################
+# Columnar export: a Parquet dataset partitioned by YEAR / PERIOD
+# i.e. <path>/YEAR=2024/PERIOD=Q1/*.parquet
+# Readers can load only the columns and the quarters they need.
+
+# Thousands separators of the text counts: "1,200", "1 200" (with a space or a no-break space)
+THOUSANDS_PATTERN = r'(?<=\d)[,\s\u00a0](?=\d{3}\b)'
+
+
+def to_count(series):
+    # Text counts to numbers, without their thousands separators ("1,200" -> 1200).
+    # Empty or non numeric values become null
+    if series.dtype.kind not in 'iufb':
+        values = series.astype(object).to_numpy(copy=True)
+        text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+        values[text] = (pd.Series(values[text], dtype=object).str.strip()
+                        .str.replace(THOUSANDS_PATTERN, '', regex=True).to_numpy())
+        series = pd.Series(values, index=series.index)
+    return pd.to_numeric(series, errors='coerce').round().astype('Int64')
+
+
+def parquet_schema():
+    import pyarrow as pa
+    fields = []
+    for column in MASTER_COLUMNS:
+        if column in PARQUET_COUNT_COLUMNS:
+            fields.append(pa.field(column, pa.int64()))
+        elif column in PARQUET_CATEGORY_COLUMNS:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def parquet_frame(df):
+    # Cast the master columns to the types of the Parquet schema
+    df = df.reindex(columns=MASTER_COLUMNS)
+    out = pd.DataFrame(index=range(len(df)))
+    for column in MASTER_COLUMNS:
+        values = df[column].reset_index(drop=True)
+        if column in PARQUET_COUNT_COLUMNS:
+            out[column] = to_count(values)
+        else:
+            # every other column is text
+            values = values.astype(object).where(values.notna(), None)
+            values = values.map(lambda value: value if value is None else str(value))
+            out[column] = values.astype('category') if column in PARQUET_CATEGORY_COLUMNS else values
+    return out
+
+
+def parquet_columns_match(path):
+    # True when the files of the dataset have the columns of the current schema.
+    # Otherwise (e.g. new master columns) the whole dataset has to be written again
+    import pyarrow.parquet as pq
+    for folder, _, files in os.walk(path):
+        for file in files:
+            if file.endswith('.parquet'):
+                columns = pq.read_schema(os.path.join(folder, file)).names
+                return set(columns) | set(PARQUET_PARTITION_COLUMNS) == set(MASTER_COLUMNS)
+    return False
+
+
+def export_parquet(df, path, replace=True, basename_template=None):
+    # Write the rows of df to the partitioned Parquet dataset.
+    # With replace=True the partitions present in df are replaced, the others are left as they are
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    # every partition is written with the categories of its own rows only, so its
+    # files are the same whether it is written alone or with the other partitions
+    for _, part in df.groupby(PARQUET_PARTITION_COLUMNS, sort=False, dropna=False):
+        table = pa.Table.from_pandas(parquet_frame(part), schema=parquet_schema(), preserve_index=False)
+        pq.write_to_dataset(table, path,
+                            partition_cols=PARQUET_PARTITION_COLUMNS,
+                            existing_data_behavior='delete_matching' if replace else 'overwrite_or_ignore',
+                            basename_template=basename_template)
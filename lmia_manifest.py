@@ -0,0 +1,101 @@
+# Manifest of the resources already processed into the master output.
+# For every resource it keeps the sha256 of the raw file, the number of rows
+# it produced, its YEAR / PERIOD and its layout, so a run only transforms the
+# new or changed resources and merges their rows into the existing master file.
+# The merge reads the whole master file back: the steps after it (employer ids,
+# address split, exports) still run over every row, only the transforms and
+# the rewritten partitions / aggregate slices are limited to the new rows.
+# A manifest of another MANIFEST_VERSION (written by a run that read the files
+# differently) is ignored, so every resource is processed again.
+
+import json
+import os
+
+import pandas as pd
+
+# 2: the raw files are read as text with the options of their header (lmia_sniff.py)
+# 3: 5-digit NOC 2021 codes in NOC_code (the aggregates of every period are computed again)
+# 4: empty LMIAs in the aggregates of the periods without LMIAs, no "Other employers" in the top employers
+MANIFEST_VERSION = 4
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('_version') != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(path, manifest):
+    manifest['_version'] = MANIFEST_VERSION
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def manifest_entry(sha256, rows, year, period, layout):
+    # The entry of a processed resource. A resource whose columns match no known
+    # layout has no rows and no layout
+    return {'sha256': sha256, 'rows': rows, 'year': year, 'period': period, 'layout': layout}
+
+
+def changed_resources(manifest, names, source_hashes):
+    # Names of the resources that are new, or whose raw file changed since the last run.
+    # Resources that were not downloaded are left as they are in the master file
+    changed = []
+    for name in names:
+        if name not in source_hashes:
+            continue
+        entry = manifest.get(name)
+        if entry is None or entry['sha256'] != source_hashes[name]:
+            changed.append(name)
+    return changed
+
+
+def merge_into_master(master_path, new_datasets, periods):
+    # Build the master DataFrame from the existing master file and the new datasets.
+    # new_datasets is a dictionary {(YEAR, PERIOD): DataFrame of the processed rows}
+    # (they get the YEAR and PERIOD columns of their key) and periods is the
+    # ordered list of every (YEAR, PERIOD), which keeps the rows in a stable order.
+    # The existing rows are read as text so they are written back unchanged.
+    # Only the empty cells are missing values (like in the freshly parsed rows), so
+    # a name such as "NA" stays as it is
+    if os.path.exists(master_path):
+        existing_df = pd.read_csv(master_path, index_col=0, dtype=str, keep_default_na=False)
+        existing_df = existing_df.where(existing_df != '', None)
+        # the 2014 - 2016 files have an empty PERIOD: it stays '' like in the new
+        # rows, as it is a key of the periods (and of the Parquet partitions)
+        existing_df['PERIOD'] = existing_df['PERIOD'].fillna('')
+        existing_groups = dict(list(existing_df.groupby(['YEAR', 'PERIOD'], sort=False)))
+    else:
+        existing_df = None
+        existing_groups = {}
+
+    datasets = []
+    for key in periods:
+        if key in new_datasets:
+            datasets.append(new_datasets[key].assign(YEAR=key[0], PERIOD=key[1]))
+        elif key in existing_groups:
+            datasets.append(existing_groups[key])
+    master_df = pd.concat(datasets)
+    if existing_df is not None:
+        master_df = master_df.reindex(columns=existing_df.columns.union(master_df.columns, sort=False))
+    return master_df
+
+
+def existing_period_chunks(master_path, key, chunksize):
+    # The rows of one (YEAR, PERIOD) of the existing master file, in chunks of at most
+    # chunksize rows, read as text like in merge_into_master. The streaming mode keeps
+    # with them the periods whose resource was not downloaded
+    if not os.path.exists(master_path):
+        return
+    year, period = key
+    for chunk in pd.read_csv(master_path, index_col=0, dtype=str, keep_default_na=False, chunksize=chunksize):
+        rows = chunk[(chunk['YEAR'] == str(year)).to_numpy() & (chunk['PERIOD'] == str(period)).to_numpy()]
+        if len(rows):
+            rows = rows.where(rows != '', None)
+            rows['PERIOD'] = rows['PERIOD'].fillna('')
+            yield rows
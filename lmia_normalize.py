@@ -0,0 +1,122 @@
+# Compact dtypes of the master DataFrame.
+# After the merge almost every column is text (object), with the long NOC
+# labels repeated on every row. normalize_master casts:
+#   - Positions and LMIAs to nullable integers (Int64)
+#   - Province, Stream, PERIOD, Incorporate_status and the other text columns
+#     with few distinct values to categoricals, the empty cells as missing values
+#   - NOC_label out of the frame: the labels are kept once per NOC_code in
+#     the lookup table of noc_table (an extra output), and parsed back from
+#     the NOC categories when the rows are exported (with_noc_labels), so the
+#     NOC text of the source files is written unchanged
+#   - the row numbers read back from the master file (text) to integers
+# The csv text of the exported rows is the same, except for the counts that
+# are written as whole numbers ("4" instead of "4.0", "1200" instead of
+# "1,200"). The counts that are not numbers are written empty and counted in
+# the run report (unconverted_counts).
+
+import numpy as np
+import pandas as pd
+
+from lmia_export import to_count
+from lmia_transform import parse_noc
+
+COUNT_COLUMNS = ['Positions', 'LMIAs']
+# always categoricals
+CATEGORY_COLUMNS = ['Province', 'Stream', 'PERIOD', 'Incorporate_status', 'YEAR', 'NOC', 'NOC_code',
+                    'Province_code', 'FSA']
+# keys of the periods: the empty PERIOD of the yearly files is a value, not a missing one
+KEY_COLUMNS = ['YEAR', 'PERIOD']
+# the other text columns are categoricals when they have at most this share of distinct values
+CATEGORY_MAX_SHARE = 0.5
+NOC_TABLE_COLUMNS = ['NOC_code', 'NOC_version', 'NOC_label', 'Rows']
+
+
+def memory_mb(df):
+    # Memory of a DataFrame in MB, the text values included
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def unconverted_counts(df):
+    # Number of non-empty Positions and LMIAs that are not counts (left empty by to_count)
+    unconverted = 0
+    for column in COUNT_COLUMNS:
+        if column in df:
+            values = df[column].astype(object)
+            filled = values.notna() & (values.astype(str).str.strip() != '')
+            unconverted += int((filled & to_count(df[column]).isna()).sum())
+    return unconverted
+
+
+def warn_unconverted(unconverted):
+    if unconverted:
+        print('Warning: ' + str(unconverted) + ' Positions or LMIAs are not numbers, they are written empty')
+
+
+def normalize_counts(df):
+    # Positions and LMIAs as nullable integers
+    for column in COUNT_COLUMNS:
+        if column in df:
+            df[column] = to_count(df[column])
+    return(df)
+
+
+def noc_version(codes):
+    # '2011' for the 4-digit NOC codes, '2021' for the 5-digit ones
+    codes = codes.astype(object)
+    return pd.Series(np.select([codes.str.len() == 4, codes.str.len() == 5], ['2011', '2021'], ''),
+                     index=codes.index)
+
+
+def noc_counts(df):
+    # Rows of every (NOC_code, NOC_label), to build the lookup table of the NOC codes
+    pairs = pd.DataFrame({'NOC_code': df['NOC_code'].astype(object), 'NOC_label': df['NOC_label'].astype(object)})
+    pairs = pairs[pairs['NOC_code'].notna()]
+    return pairs.groupby(['NOC_code', 'NOC_label'], dropna=False).size().rename('Rows').reset_index()
+
+
+def noc_table(parts):
+    # Lookup table of the NOC codes from the noc_counts of the rows (or of chunks of them):
+    # one row per NOC_code with its NOC version and its most frequent label
+    counts = pd.concat(parts) if parts else pd.DataFrame(columns=['NOC_code', 'NOC_label', 'Rows'])
+    counts = counts.groupby(['NOC_code', 'NOC_label'], dropna=False)['Rows'].sum().reset_index()
+    rows = counts.groupby('NOC_code')['Rows'].sum()
+    table = counts.sort_values(['NOC_code', 'Rows', 'NOC_label'], ascending=[True, False, True])
+    table = table.drop_duplicates('NOC_code').reset_index(drop=True)
+    table['Rows'] = table['NOC_code'].map(rows).to_numpy()
+    table['NOC_version'] = noc_version(table['NOC_code'])
+    return table.sort_values(['NOC_version', 'NOC_code'], kind='stable')[NOC_TABLE_COLUMNS]
+
+
+def compact_index(index):
+    # The row numbers as integers when they are text (the rows read back from the
+    # master file) and written the same way, the index as it is otherwise
+    if index.dtype.kind in 'iu':
+        return index
+    text = pd.Index(index.astype(str))
+    numbers = pd.to_numeric(text, errors='coerce')
+    if numbers.isna().any() or not (numbers.astype('int64').astype(str) == text).all():
+        return index
+    return pd.Index(numbers.astype('int64'), name=index.name)
+
+
+def normalize_master(df):
+    # The master DataFrame with compact dtypes and without the NOC_label column
+    df = normalize_counts(df.drop(columns=['NOC_label'], errors='ignore'))
+    df.index = compact_index(df.index)
+    for column in df.columns:
+        if column in COUNT_COLUMNS or isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        # an empty cell is a missing value, not a category
+        values = df[column].astype(object)
+        if column not in KEY_COLUMNS:
+            values = values.where(values != '', None)
+        if column in CATEGORY_COLUMNS or values.nunique() <= CATEGORY_MAX_SHARE * len(df):
+            df[column] = values.astype('category')
+    return(df)
+
+
+def with_noc_labels(df):
+    # The rows with the NOC_label column, parsed from the distinct NOC values only
+    noc = df['NOC'].astype('category')
+    _, labels = parse_noc(pd.Series(noc.cat.categories, dtype=object))
+    return df.assign(NOC_label=noc.map(dict(zip(noc.cat.categories, labels))))
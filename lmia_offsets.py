@@ -0,0 +1,101 @@
+# Byte-offset index of the exported csv files.
+# The rows of the master csv file and of its splits are grouped by YEAR /
+# PERIOD and, inside a period, mostly by Province. ChunkedCsvExport (see
+# lmia_export.py) records the byte range of every run of rows with the same
+# YEAR / PERIOD / Province in a small sidecar file:
+#   {csv file: {'compression', 'bytes', 'header', 'ranges': [[YEAR, PERIOD, Province, start, end, rows]]}}
+# read_csv_slices memory-maps a csv file and parses only the ranges of the
+# requested years, periods and provinces. The csv files are not changed.
+# The offsets of a compressed file are the ones of its uncompressed text.
+
+import gzip
+import io
+import json
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CSV = 'Employer_list_positive_LMIA_Canada.csv'
+DEFAULT_OFFSETS = 'Employer_list_positive_LMIA_Canada_offsets.json'
+OFFSET_KEYS = ['YEAR', 'PERIOD', 'Province']
+
+
+def offset_columns(df):
+    # YEAR, PERIOD and Province of the rows as arrays of text, empty values as ''
+    return [df[column].astype(object).fillna('').astype(str).to_numpy(dtype=object) if column in df
+            else np.full(len(df), '', dtype=object) for column in OFFSET_KEYS]
+
+
+def run_starts(columns):
+    # Start of every run of rows with the same YEAR / PERIOD / Province, and the number of rows at the end
+    rows = len(columns[0])
+    changed = np.zeros(max(rows - 1, 0), dtype=bool)
+    for values in columns:
+        changed |= values[1:] != values[:-1]
+    return [0] + (np.flatnonzero(changed) + 1).tolist() + [rows]
+
+
+def load_offsets(path=DEFAULT_OFFSETS):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def select_ranges(entry, years=None, periods=None, provinces=None):
+    # Byte ranges [(start, end)] of the rows of the given years, periods and provinces
+    # (all of them by default). A period given as 'Q2' also selects 'Q1-Q2'.
+    # Adjacent ranges are merged, so they are read in one slice
+    if years is not None:
+        years = {str(year) for year in ([years] if isinstance(years, (str, int)) else years)}
+    if periods is not None:
+        periods = {periods} if isinstance(periods, str) else set(periods)
+    if provinces is not None:
+        provinces = {provinces} if isinstance(provinces, str) else set(provinces)
+    ranges = []
+    for (year, period, province, start, end, _) in entry['ranges']:
+        if years is not None and year not in years:
+            continue
+        if periods is not None and period not in periods and not periods & set(period.split('-')):
+            continue
+        if provinces is not None and province not in provinces:
+            continue
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def read_ranges(path, entry, ranges):
+    # The header line and the bytes of the ranges of a csv file.
+    # A plain file is memory-mapped, so only the pages of the ranges are read
+    if entry.get('compression') == 'gzip':
+        # a gzip file can only be read forward: the ranges are in the order of the file
+        with gzip.open(path, 'rb') as f:
+            pieces = [f.read(entry['header'])]
+            for start, end in ranges:
+                f.seek(start)
+                pieces.append(f.read(end - start))
+        return b''.join(pieces)
+    if os.path.getsize(path) != entry['bytes']:
+        raise ValueError('The offsets of ' + path + ' do not match the file, export it again')
+    with open(path, 'rb') as f:
+        if entry['bytes'] == 0:
+            return b''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data[:entry['header']] + b''.join(data[start:end] for start, end in ranges)
+
+
+def read_csv_slices(years=None, periods=None, provinces=None, path=DEFAULT_CSV, offsets_path=DEFAULT_OFFSETS):
+    # Rows of an exported csv file (the master file or a split) for the given
+    # years, periods and provinces, read as text like the master file.
+    #   read_csv_slices(years=2024, periods='Q1', provinces='Ontario')
+    offsets = load_offsets(offsets_path)
+    if path not in offsets:
+        raise KeyError('No offsets for ' + path + ' in ' + offsets_path)
+    entry = offsets[path]
+    content = read_ranges(path, entry, select_ranges(entry, years, periods, provinces))
+    return pd.read_csv(io.BytesIO(content), index_col=0, dtype=str, keep_default_na=False)
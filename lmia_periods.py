@@ -0,0 +1,137 @@
+# Export of the master rows one period at a time.
+# The streaming mode (chunks of every resource) and the out-of-core mode (the
+# periods of the DuckDB master table, see lmia_engine.py) hand their rows to a
+# PeriodExport, which writes them to the master csv file and its splits, the
+# Parquet partitions and the SQLite database, and adds up the aggregates (cube,
+# top employers, delta and NOC table) over the periods:
+#   export.start_period(key)   # key is (YEAR, PERIOD)
+#   export.write(rows)         # once or more per period (e.g. once per chunk)
+#   export.finish_period()
+#   written = export.close()
+# The rows are not kept, only their (small) aggregates, so the memory is bounded
+# by the largest period (or chunk) instead of the whole master file.
+# With changed_periods (the periods of the new or changed resources) only the
+# aggregate slices of these periods are computed again and replaced in the
+# files: the cube of the periods, the delta of the periods and of the ones
+# after them, and the top employers of their years and of the years of the
+# periods where an Employer_id changed (see lmia_cube.py).
+
+import shutil
+
+import pandas as pd
+
+from lmia_cube import (CUBE_KEYS, combine, combine_employer_totals, employer_totals, quarter_cube, top_employers,
+                       update_aggregate)
+from lmia_delta import DELTA_COLUMNS, combine_period_totals, period_delta, period_totals
+from lmia_export import ChunkedCsvExport, export_parquet
+from lmia_normalize import noc_counts, noc_table, normalize_counts, unconverted_counts, warn_unconverted
+from lmia_sqlite import create_database, finish_database, insert_rows
+from lmia_transform import MASTER_COLUMNS
+
+# Columns of the employer totals (see lmia_cube.py)
+TOTALS_COLUMNS = ['YEAR', 'Employer_key', 'Employer', 'Positions', 'LMIAs', 'Rows']
+
+
+class PeriodExport:
+
+    def __init__(self, names, rows_per_file, compression=None, parquet_rebuild=True, database=None,
+                 changed_periods=None):
+        # names: {'master', 'base', 'parquet', 'cube', 'top_employers', 'delta', 'noc'} file names.
+        # The Parquet dataset is written from scratch when parquet_rebuild is set.
+        # database: path of the SQLite database to build (none by default).
+        # changed_periods: the (YEAR, PERIOD) whose aggregate slices are replaced, all of them
+        # (the aggregate files are written again) by default
+        self.names = names
+        self.csv = ChunkedCsvExport(names['master'], names['base'], rows_per_file, MASTER_COLUMNS,
+                                    compression=compression)
+        if parquet_rebuild:
+            shutil.rmtree(names['parquet'], ignore_errors=True)
+        self.database = database
+        self.conn = create_database(database) if database else None
+        self.cube_parts = []
+        self.totals_parts = []
+        self.delta_parts = []
+        self.noc_parts = []
+        self.noc_df = None
+        self.unconverted = 0
+        self.previous = None
+        self.changed_periods = changed_periods
+        self.changed_years = None if changed_periods is None else {year for (year, _) in changed_periods}
+
+    @property
+    def rows_written(self):
+        return self.csv.rows_written
+
+    def changed(self, key):
+        return self.changed_periods is None or key in self.changed_periods
+
+    def start_period(self, key):
+        self.csv.start_period()
+        self.period = key
+        self.period_rows = 0
+        self.period_cube_parts = []
+        self.period_totals_parts = []
+        self.period_delta_parts = []
+
+    def write(self, dataset, parquet=True, basename_template='part-{i}.parquet', replace=True):
+        # Write rows of the current period. parquet: write them to their Parquet partition,
+        # replacing it (replace=True) or adding files to it with basename_template
+        self.unconverted += unconverted_counts(dataset)
+        dataset = normalize_counts(dataset)
+        self.noc_parts.append(noc_counts(dataset))
+        self.csv.write(dataset)
+        self.period_rows += len(dataset)
+        if parquet:
+            export_parquet(dataset, self.names['parquet'], replace=replace, basename_template=basename_template)
+        if self.conn is not None:
+            insert_rows(self.conn, dataset)
+        if self.changed(self.period):
+            self.period_cube_parts.append(quarter_cube(dataset))
+        self.period_totals_parts.append(employer_totals(dataset))
+        self.period_delta_parts.append(period_totals(dataset))
+
+    def finish_period(self, ids_changed=False):
+        # Add up the aggregates of the rows of the period. A period without rows has no
+        # aggregates. The delta only needs the totals of the period before it.
+        # ids_changed: an Employer_id of the period changed, so the top employers of its
+        # year are computed again
+        key = self.period
+        if ids_changed and self.changed_years is not None:
+            self.changed_years.add(key[0])
+        if not self.period_rows:
+            return
+        if self.changed(key):
+            self.cube_parts.append(combine(self.period_cube_parts, CUBE_KEYS))
+        self.totals_parts.append(combine_employer_totals(self.period_totals_parts))
+        current = (key, combine_period_totals(self.period_delta_parts))
+        if self.previous is not None and (self.changed(key) or self.changed(self.previous[0])):
+            self.delta_parts.append(period_delta(self.previous[1], current[1], current[0], self.previous[0]))
+        self.previous = current
+
+    def close(self):
+        # Close the csv files and write the aggregates. Returns the csv files written
+        written = self.csv.close()
+        names = self.names
+        if self.changed_periods is None:
+            periods = None
+            years = None
+        else:
+            periods = self.changed_periods
+            years = {(year,) for year in self.changed_years}
+        update_aggregate(names['cube'], combine(self.cube_parts, CUBE_KEYS), ['YEAR', 'PERIOD'], periods)
+        totals = pd.concat(self.totals_parts) if self.totals_parts else pd.DataFrame(columns=TOTALS_COLUMNS)
+        if years is not None:
+            totals = totals[[(year,) in years for year in totals['YEAR']]]
+        update_aggregate(names['top_employers'], top_employers(totals), ['YEAR'], years)
+        print('Exported ' + names['cube'] + ' & ' + names['top_employers'] + '\n')
+        delta = pd.concat(self.delta_parts) if self.delta_parts else pd.DataFrame(columns=DELTA_COLUMNS)
+        update_aggregate(names['delta'], delta, ['YEAR', 'PERIOD'], periods)
+        print('Exported ' + names['delta'] + '\n')
+        self.noc_df = noc_table(self.noc_parts)
+        self.noc_df.to_csv(names['noc'], index=False)
+        print('Exported ' + names['noc'] + ' (' + str(len(self.noc_df)) + ' NOC codes)\n')
+        if self.conn is not None:
+            finish_database(self.conn, self.database)
+            print('Exported ' + self.database + '\n')
+        warn_unconverted(self.unconverted)
+        return written
@@ -0,0 +1,86 @@
+# Instrumentation of a pipeline run.
+# Every stage (catalog, download, parse, transform, exports...) and every
+# resource records its wall time, rows in / out, bytes downloaded and the peak
+# RSS of the process, and the whole run is written to a JSON report.
+# With a profile folder, the hot stages are also profiled with cProfile
+# (one .prof file per stage, to open with pstats or snakeviz).
+
+import cProfile
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    # Peak resident memory of the process so far
+    if resource is None:
+        return None
+    # ru_maxrss is in kB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+
+class RunReport:
+
+    def __init__(self, profile_dir=None):
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.start_time = time.perf_counter()
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.resources = {}
+        self.running = {}
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def start(self, stage, profile=False):
+        # Start the clock of a stage. Hot stages are profiled when a profile folder is set
+        profiler = None
+        if profile and self.profile_dir:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        self.running[stage] = (time.perf_counter(), profiler)
+
+    def stop(self, stage, **fields):
+        # Stop the clock of a stage and return its record with the extra fields
+        start, profiler = self.running.pop(stage)
+        record = {'seconds': round(time.perf_counter() - start, 4)}
+        record.update(fields)
+        record['peak_rss_mb'] = peak_rss_mb()
+        if profiler is not None:
+            profiler.disable()
+            record['profile'] = os.path.join(self.profile_dir, stage.replace(' ', '_') + '.prof')
+            profiler.dump_stats(record['profile'])
+        return record
+
+    def finish(self, stage, **fields):
+        # Record a stage with extra fields (rows_in, rows_out, bytes...)
+        record = dict(stage=stage, **self.stop(stage, **fields))
+        self.stages.append(record)
+        print('[report] ' + stage + ': %.3f s' % record['seconds'])
+        return record
+
+    def finish_resource(self, name, step, **fields):
+        # Record one step (transform, stream...) of a resource, started with start(name)
+        self.add_resource(name, **{step: self.stop(name, **fields)})
+
+    def add_resource(self, name, **fields):
+        # Add or update the measures of one resource
+        self.resources.setdefault(name, {}).update(fields)
+
+    def write(self, path, **fields):
+        report = {'started_at': self.started_at,
+                  'seconds': round(time.perf_counter() - self.start_time, 4),
+                  'peak_rss_mb': peak_rss_mb()}
+        report.update(fields)
+        report['stages'] = self.stages
+        report['resources'] = self.resources
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+            f.write('\n')
+        print('Run report written to ' + path)
@@ -0,0 +1,153 @@
+# Header sniffing of the raw LMIA files.
+# Only the first rows of a file are read (the first SNIFF_BYTES of a csv file,
+# the first SNIFF_ROWS rows of an Excel sheet) to find the row of the column
+# names. Its column signature gives the layout of the file, the rows above it
+# and the positions of the columns to read. The notes at the bottom of a csv
+# file are cut off before parsing, so they are never read into the DataFrame.
+# The whole file is then parsed once, as text, with these options.
+
+import csv
+import io
+
+from lmia_download import CSV_ENCODING, read_resource
+
+SNIFF_BYTES = 64 * 1024
+SNIFF_ROWS = 20
+
+# Field of a column name, from the first keyword found in it (case insensitive)
+FIELD_KEYWORDS = [
+    ('province', 'province'),
+    ('stream', 'stream'),
+    ('employer', 'employer'),
+    ('address', 'address'),
+    ('occupation', 'occupation'),
+    ('noc', 'occupation'),
+    ('incorporat', 'incorporate_status'),
+    ('lmia', 'lmias'),
+    ('position', 'positions'),
+]
+
+# Fields of the column names of every layout, in the order of the file
+LAYOUT_SIGNATURES = {
+    '2014_2015': ('employer', 'address', 'positions'),
+    '2016': ('province', 'employer', 'address', 'occupation', 'positions'),
+    '2017_q1_to_2021_q3': ('province', 'stream', 'employer', 'address', 'occupation', 'positions'),
+    '2021_q4_to_2024_q1': ('province', 'stream', 'employer', 'address', 'occupation', 'incorporate_status',
+                           'lmias', 'positions'),
+}
+SIGNATURE_LAYOUTS = {signature: layout for layout, signature in LAYOUT_SIGNATURES.items()}
+
+# The notes start on a line "Notes:" (quoted or not) in the first column
+NOTES_LINES = [b'\nNotes:', b'\n"Notes:']
+
+
+def column_field(name):
+    # Field of a column name, None when it is not a known column name
+    name = str(name).strip().lower()
+    for keyword, field in FIELD_KEYWORDS:
+        if keyword in name:
+            return field
+    return None
+
+
+def header_signature(row):
+    # (fields, positions) of the non-empty cells of a row, None when a cell is not a column name
+    fields = []
+    positions = []
+    for position, value in enumerate(row):
+        if value is None or str(value).strip() == '':
+            continue
+        field = column_field(value)
+        if field is None:
+            return None
+        fields.append(field)
+        positions.append(position)
+    return tuple(fields), positions
+
+
+def sniff_rows(rows):
+    # (layout, header_row, usecols) of the first row matching a layout signature, None otherwise
+    for number, row in enumerate(rows):
+        signature = header_signature(row)
+        if signature is not None and signature[0] in SIGNATURE_LAYOUTS:
+            return SIGNATURE_LAYOUTS[signature[0]], number, signature[1]
+    return None
+
+
+def first_rows(content, format, max_rows=SNIFF_ROWS):
+    # The first rows of a file as lists of values, without parsing the rest of it
+    if format == 'csv':
+        sample = content[:SNIFF_BYTES]
+        if len(content) > SNIFF_BYTES:
+            # the last line of the sample may be cut
+            sample = sample[:sample.rfind(b'\n') + 1]
+        reader = csv.reader(io.StringIO(sample.decode(CSV_ENCODING)))
+        return [row for _, row in zip(range(max_rows), reader)]
+    if format == 'xlsx':
+        # openpyxl reads the sheet lazily in read-only mode
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        rows = [list(row) for _, row in zip(range(max_rows), workbook.active.iter_rows(values_only=True))]
+        workbook.close()
+        return rows
+    if format == 'xls':
+        import pandas as pd
+        frame = pd.read_excel(io.BytesIO(content), header=None, nrows=max_rows).astype(object)
+        return frame.where(frame.notna(), None).values.tolist()
+    return []
+
+
+def line_end(content, line):
+    # Byte offset of the end of a line of a csv file (0 for the line before the first one)
+    offset = 0
+    for _ in range(line + 1):
+        offset = content.find(b'\n', offset) + 1
+        if offset == 0:
+            return len(content)
+    return offset
+
+
+def notes_offset(content, header_row=0):
+    # Byte offset of the notes of a csv file (the length of the file when there are none).
+    # The notes are at the bottom, so the file is searched from the end, and only
+    # after the row of the column names. When no data row would be left above the
+    # notes, the file is not cut: the note lines are dropped by the row filters
+    # (see lmia_filters.py) instead
+    header_end = line_end(content, header_row)
+    offset = max(content.rfind(line, header_end - 1) for line in NOTES_LINES)
+    if offset < 0 or not content[header_end:offset].strip():
+        return len(content)
+    return offset + 1
+
+
+def sniff_layout(content, format):
+    # Layout of the header of a raw file, None when no row matches a layout
+    found = sniff_rows(first_rows(content, format))
+    return found[0] if found is not None else None
+
+
+def sniff(content, format, default_layout=None):
+    # (layout, read options) of a raw file. The options are the keyword arguments
+    # of read_resource and iter_resource_chunks (see lmia_download.py).
+    # When no row matches a layout, the file is read as before with the default
+    # layout (None for a file that is not an LMIA employer list)
+    options = {'header_row': 0, 'usecols': None}
+    found = sniff_rows(first_rows(content, format))
+    if found is not None:
+        layout, options['header_row'], options['usecols'] = found
+        if default_layout is not None and layout != default_layout:
+            print('The columns of the file match the layout ' + layout + ', not ' + default_layout)
+    else:
+        layout = default_layout
+    if format == 'csv':
+        options['end'] = notes_offset(content, options['header_row'])
+    return layout, options
+
+
+def read_sniffed(content, format, default_layout=None):
+    # (layout, DataFrame) of a raw file parsed with the options of its header.
+    # The values are kept as text; the DataFrame is None when the layout is unknown
+    layout, options = sniff(content, format, default_layout)
+    if layout is None:
+        return None, None
+    return layout, read_resource(content, format, dtype=str, **options)
@@ -0,0 +1,143 @@
+# SQLite database of the master DataFrame.
+# One row per master row in the "employers" table, with B-tree indexes on
+# NOC_code, Province, FSA and YEAR / PERIOD, and an FTS5 full-text table over
+# Employer and Address, so a lookup takes milliseconds instead of a full scan
+# of the csv files.
+#
+# Query the database from the command line:
+#   python lmia_sqlite.py --employer "tim hortons" --province Ontario --year 2024
+#   python lmia_sqlite.py --fsa L6
+
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+from lmia_export import PARQUET_COUNT_COLUMNS, to_count
+from lmia_transform import MASTER_COLUMNS
+
+DEFAULT_DATABASE = 'Employer_list_positive_LMIA_Canada.sqlite'
+
+INDEXES = {
+    'employers_noc_code': ['NOC_code'],
+    'employers_province': ['Province'],
+    'employers_fsa': ['FSA'],
+    'employers_year_period': ['YEAR', 'PERIOD'],
+}
+
+
+def create_database(path):
+    # Start a new database in a temporary file, moved in place by finish_database
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    columns = ', '.join(f'"{column}" INTEGER' if column in PARQUET_COUNT_COLUMNS else f'"{column}" TEXT'
+                        for column in MASTER_COLUMNS)
+    conn.execute(f'CREATE TABLE employers (id INTEGER PRIMARY KEY, {columns})')
+    return conn
+
+
+def insert_rows(conn, df):
+    # Append the rows of a (chunk of the) master DataFrame
+    df = df.reindex(columns=MASTER_COLUMNS)
+    values = {}
+    for column in MASTER_COLUMNS:
+        if column in PARQUET_COUNT_COLUMNS:
+            values[column] = to_count(df[column]).astype(object)
+        else:
+            # empty text is stored as NULL, like the missing values
+            values[column] = df[column].astype(object).map(lambda value: None if pd.isna(value) or value == ''
+                                                            else str(value))
+    values = pd.DataFrame(values).astype(object)
+    values = values.where(values.notna(), None)
+    placeholders = ', '.join('?' for _ in MASTER_COLUMNS)
+    names = ', '.join(f'"{column}"' for column in MASTER_COLUMNS)
+    conn.executemany(f'INSERT INTO employers ({names}) VALUES ({placeholders})',
+                     values.itertuples(index=False, name=None))
+
+
+def finish_database(conn, path):
+    # Build the indexes and the full-text table once all the rows are in
+    for name, columns in INDEXES.items():
+        conn.execute(f'CREATE INDEX {name} ON employers (' + ', '.join(f'"{c}"' for c in columns) + ')')
+    conn.execute("CREATE VIRTUAL TABLE employers_fts USING fts5("
+                 "Employer, Address, content='employers', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+    conn.execute("INSERT INTO employers_fts(employers_fts) VALUES('rebuild')")
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    os.replace(path + '.tmp', path)
+
+
+def build_database(df, path=DEFAULT_DATABASE):
+    conn = create_database(path)
+    insert_rows(conn, df)
+    finish_database(conn, path)
+
+
+def query(path=DEFAULT_DATABASE, employer=None, address=None, noc=None, province=None,
+          year=None, period=None, fsa=None, limit=50):
+    # Look up rows by employer / address words (full-text) and exact filters
+    conditions = []
+    params = []
+    match = []
+    # text without any word does not filter the rows
+    for column, text in [('Employer', employer), ('Address', address)]:
+        phrase = fts_phrase(text) if text else None
+        if phrase:
+            match.append(column + ' : ' + phrase)
+    if match:
+        conditions.append('e.id IN (SELECT rowid FROM employers_fts WHERE employers_fts MATCH ?)')
+        params.append(' AND '.join(match))
+    for column, value in [('NOC_code', noc), ('Province', province), ('YEAR', year), ('PERIOD', period)]:
+        if value is None:
+            continue
+        # the empty text is stored as NULL, e.g. the PERIOD of the yearly 2014 - 2016 files
+        if str(value) == '':
+            conditions.append(f'e."{column}" IS NULL')
+        else:
+            conditions.append(f'e."{column}" = ?')
+            params.append(str(value))
+    if fsa:
+        # FSA prefix (L, L6 or L6S) as a range of the index
+        prefix = fsa.upper().rstrip('*')
+        conditions.append('e."FSA" >= ? AND e."FSA" < ?')
+        params.extend([prefix, prefix + '\uffff'])
+    sql = 'SELECT e.* FROM employers e'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY e.id LIMIT ?'
+    params.append(limit)
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(sql, conn, params=params, index_col='id')
+
+
+def fts_phrase(text):
+    # Every word of the text must be in the column (prefix match on the words).
+    # None when the text has no word
+    words = [word.replace('"', '') for word in text.split()]
+    words = [word for word in words if word]
+    if not words:
+        return None
+    return '(' + ' AND '.join(f'"{word}"*' for word in words) + ')'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the SQLite database of the positive LMIA employers')
+    parser.add_argument('--db', default=DEFAULT_DATABASE)
+    parser.add_argument('--employer', help='words of the employer name')
+    parser.add_argument('--address', help='words of the address')
+    parser.add_argument('--noc', help='NOC code')
+    parser.add_argument('--province')
+    parser.add_argument('--year')
+    parser.add_argument('--period', help='Q1, Q2, Q3, Q4 or Q1-Q2')
+    parser.add_argument('--fsa', help='forward sortation area or its prefix, e.g. L6S or L6')
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    result = query(args.db, employer=args.employer, address=args.address, noc=args.noc,
+                   province=args.province, year=args.year, period=args.period, fsa=args.fsa, limit=args.limit)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(result)
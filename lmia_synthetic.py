@@ -0,0 +1,118 @@
+# Synthetic raw files in the four layouts of the LMIA employer lists.
+# The frames look like the published files once read by pandas: nested
+# province rows, empty cells filled by ffill, repeated column names and the
+# note lines at the bottom. Used by the benchmarks, fully offline.
+
+import numpy as np
+import pandas as pd
+
+PROVINCES = ['Alberta', 'British Columbia', 'Manitoba', 'New Brunswick', 'Newfoundland and Labrador',
+             'Nova Scotia', 'Ontario', 'Prince Edward Island', 'Quebec', 'Saskatchewan', 'Yukon']
+PROVINCE_CODES = ['AB', 'BC', 'MB', 'NB', 'NL', 'NS', 'ON', 'PE', 'QC', 'SK', 'YT']
+CITIES = ['Calgary', 'Vancouver', 'Winnipeg', 'Moncton', "St. John's",
+          'Halifax', 'Brampton', 'Charlottetown', 'Montréal', 'Regina', 'Whitehorse']
+STREAMS = ['High Wage', 'Low Wage', 'Primary Agriculture', 'Global Talent Stream',
+           'Permanent Residence Pathways']
+NOCS = ['6322-Cooks', '6711-Food counter attendants, kitchen helpers and related support occupations',
+        '6311-Food service supervisors', '8431-General farm workers', '7511-Transport truck drivers',
+        '2174-Computer programmers and interactive media developers', '0631-Restaurant and food service managers']
+NOTES = ['Notes:',
+         "1. The source for all information in this report is Employment and Social Development Canada's (ESDC) Foreign Worker System (FWS).",
+         '2. This list excludes all personal names, such as employers of caregivers or business names that use or include personal names.',
+         '3. The employer name is manually entered in FWS. As such, accuracy of the names is subject to potential data entry error and inconsistent spelling.',
+         '4. Effective November 2016, NOC 2011 is being used.',
+         '5. The FWS tracks TFW positions only, not TFWs who are issued a work permit or who enter Canada.',
+         '6. The numbers appearing in this release may differ slightly from those reported in previous releases.',
+         '7. Positions approved under the Global Talent Stream are included.']
+LETTERS = np.array(list('ABCEGHJKLMNPRSTVXY'))
+
+# Column names of the files (the first row of the file)
+LAYOUT_COLUMNS = {
+    '2014_2015': ['Employer', 'Address', 'Positions'],
+    '2016': ['Province/Territory', 'Employer', 'Address', 'Occupation', 'Positions Approved'],
+    '2017_q1_to_2021_q3': ['Province/Territory', 'Program Stream', 'Employer', 'Address', 'Occupation',
+                           'Approved Positions'],
+    '2021_q4_to_2024_q1': ['Province/Territory', 'Program Stream', 'Employer', 'Address', 'Occupation',
+                           'Incorporate Status', 'Approved LMIAs', 'Approved Positions'],
+}
+
+
+def data_rows(rows, rng):
+    # Employer, address, occupation and counts of the data rows, sorted by province
+    province = np.sort(rng.integers(0, len(PROVINCES), rows))
+    employer = np.where(rng.random(rows) < 0.4,
+                        pd.Series(rng.integers(1000000, 9999999, rows)).astype(str) + ' Ontario Inc.',
+                        'Maple Farms ' + pd.Series(rng.integers(1, 50000, rows)).astype(str) + ' Ltd')
+    postal = (pd.Series(rng.choice(LETTERS, rows)) + pd.Series(rng.integers(0, 9, rows)).astype(str)
+              + pd.Series(rng.choice(LETTERS, rows)) + ' ' + pd.Series(rng.integers(0, 9, rows)).astype(str)
+              + pd.Series(rng.choice(LETTERS, rows)) + pd.Series(rng.integers(0, 9, rows)).astype(str))
+    address = (pd.Series(np.array(CITIES)[province]) + ', ' + pd.Series(np.array(PROVINCE_CODES)[province])
+               + ' ' + postal)
+    return pd.DataFrame({
+        'province': province,
+        'Province': np.array(PROVINCES, dtype=object)[province],
+        'Stream': np.array(STREAMS, dtype=object)[np.sort(rng.integers(0, len(STREAMS), rows))],
+        'Employer': employer.astype(object),
+        'Address': address.to_numpy(dtype=object),
+        'NOC': np.array(NOCS, dtype=object)[rng.integers(0, len(NOCS), rows)],
+        'Incorporate_status': np.array(['Yes', 'No', 'Unknown'], dtype=object)[rng.integers(0, 3, rows)],
+        'LMIAs': rng.integers(1, 4, rows).astype(object),
+        'Positions': rng.integers(1, 10, rows).astype(object),
+    })
+
+
+def first_of_group(values):
+    # True on the first row of each run of equal values
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    return first
+
+
+def assemble(pieces, columns):
+    frame = pd.DataFrame(np.concatenate(pieces), columns=columns)
+    return frame.astype(object)
+
+
+def generate(layout, rows, seed=0):
+    # A raw frame of the layout with about `rows` data rows
+    rng = np.random.default_rng(seed)
+    data = data_rows(rows, rng)
+    columns = LAYOUT_COLUMNS[layout]
+    width = len(columns)
+    header = np.array([columns], dtype=object)
+    notes = np.full((len(NOTES), width), np.nan, dtype=object)
+    notes[:, 0] = NOTES
+
+    if layout == '2014_2015':
+        # nested: a province row on top of the rows of each province, and the
+        # column names repeated under each province
+        pieces = []
+        for number, province in enumerate(PROVINCES):
+            block = data[data['province'] == number]
+            if len(block) == 0:
+                continue
+            pieces.append(np.array([[province, np.nan, np.nan]], dtype=object))
+            pieces.append(header)
+            pieces.append(block[['Employer', 'Address', 'Positions']].to_numpy())
+        pieces.append(np.array([['Other employers', np.nan, 57]], dtype=object))
+        pieces.append(notes)
+        return assemble(pieces, columns)
+
+    if layout == '2016':
+        # the province is only on the first row of its rows
+        values = data[['Province', 'Employer', 'Address', 'NOC', 'Positions']].to_numpy()
+        values[~first_of_group(data['province'].to_numpy()), 0] = np.nan
+        return assemble([values, header, notes], columns)
+
+    if layout == '2017_q1_to_2021_q3':
+        # the province and the stream are only on the first row of their rows
+        values = data[['Province', 'Stream', 'Employer', 'Address', 'NOC', 'Positions']].to_numpy()
+        keys = data['province'].to_numpy() * 100 + pd.factorize(data['Stream'])[0]
+        values[~first_of_group(data['province'].to_numpy()), 0] = np.nan
+        values[~first_of_group(keys), 1] = np.nan
+        return assemble([values, header, notes], columns)
+
+    # 2021-Q4 onward: every cell is filled
+    values = data[['Province', 'Stream', 'Employer', 'Address', 'NOC', 'Incorporate_status',
+                   'LMIAs', 'Positions']].to_numpy()
+    return assemble([values, notes], columns)
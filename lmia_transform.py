@@ -0,0 +1,158 @@
+# Transform functions of the raw LMIA files.
+# Files don't have consistent names and values and
+# will be processed in different batches, one function per period.
+# Every function takes a raw DataFrame (a whole file or a chunk of it) and
+# returns the cleaned rows. fill_state carries the forward-filled values
+# (Province, Stream) from one chunk to the next when a file is streamed.
+
+import numpy as np
+
+from lmia_filters import filter_rows
+
+# Columns of the master file, in the order they are exported
+MASTER_COLUMNS = ['Employer', 'Address', 'Positions', 'Province', 'NOC', 'Stream',
+                  'Incorporate_status', 'LMIAs', 'YEAR', 'PERIOD', 'NOC_code', 'NOC_label',
+                  'Employer_id', 'City', 'Province_code', 'Postal_code', 'FSA']
+
+
+def fill_down(series, fill_state=None, key=None):
+    # Fill the empty values with the value above (ffill).
+    # With a fill_state, the first empty values of a chunk get the last value
+    # of the previous chunk, and the state keeps the last value of this chunk
+    series = series.ffill()
+    if fill_state is not None:
+        if key in fill_state:
+            series = series.fillna(fill_state[key])
+        valid = series.dropna()
+        if len(valid) > 0:
+            fill_state[key] = valid.iloc[-1]
+    return series
+
+
+###############################################################################
+# Period 1: June 20 - December 31 2014 & Full 2015
+# Build a function that will process the dataset.
+
+def process_2014_2015(df_raw, fill_state=None):
+    # Work on a copy of the raw DataFrame
+    df_name = df_raw.copy()
+    # Add proper raw names for the columns
+    df_name.columns = ['Employer_raw', 'Address_raw', 'Positions_raw']
+    # The csv file is nested. i.e. ha the province listed on top and the data below.
+    # Move the province from the top to each corresponding rows
+    df_name['Province'] = np.where(df_name['Address_raw'].isnull(), df_name['Employer_raw'], np.nan)
+    # Fill the Province when it's empty
+    df_name['Province'] = fill_down(df_name['Province'], fill_state, 'Province')
+    # filter out unneccessary rows [such as Notes & repeated columns names]
+    # in a single pass, based on the rules of the layout (see lmia_filters.py)
+    df_name = filter_rows(df_name, '2014_2015')
+    # rename the column properly at the end by removing the 'raw' part
+    df_name = df_name.rename(columns={"Employer_raw": "Employer", 
+                                        "Address_raw": "Address",
+                                        "Positions_raw": "Positions"})
+    # add a few missing columns for future
+    df_name['NOC'] = np.nan
+    df_name['Stream'] = np.nan
+    df_name['Incorporate_status'] = np.nan
+    df_name['LMIAs'] = np.nan
+    return(df_name)
+
+
+###############################################################################
+# Period 2: 1 Jan - 31 Dec 2016
+# Build a function that will process the dataset.
+
+def process_2016(df_raw, fill_state=None):
+    # Work on a copy of the raw DataFrame
+    df_name = df_raw.copy()
+    # Add proper raw names for the columns
+    df_name.columns = ['Province_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Positions_raw']
+    # Fill the Province when it's empty
+    df_name['Province_raw'] = fill_down(df_name['Province_raw'], fill_state, 'Province')
+    # filter out unneccessary rows [such as Notes & repeated columns names]
+    # in a single pass, based on the rules of the layout (see lmia_filters.py)
+    df_name = filter_rows(df_name, '2016')
+    # rename the column properly at the end by removing the 'raw' part
+    df_name = df_name.rename(columns={"Province_raw": "Province",
+                                        "Employer_raw": "Employer", 
+                                        "Address_raw": "Address",
+                                        "NOC_raw":"NOC",
+                                        "Positions_raw": "Positions"})
+    # add a few missing columns for future
+    df_name['Stream'] = np.nan
+    df_name['Incorporate_status'] = np.nan
+    df_name['LMIAs'] = np.nan
+    return(df_name)
+
+
+###############################################################################
+# Period 3: 2017-Q1-Q2 to 2021-Q3
+# Build a function that will process the dataset.
+
+def process_2017_q1_to_2021_q3(df_raw, fill_state=None):
+    # Work on a copy of the raw DataFrame
+    df_name = df_raw.copy()
+    # Add proper raw names for the columns
+    df_name.columns = ['Province_raw', 'Stream_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Positions_raw']
+    # Fill the Province & Stream when it's empty
+    df_name['Stream_raw'] = fill_down(df_name['Stream_raw'], fill_state, 'Stream')
+    df_name['Province_raw'] = fill_down(df_name['Province_raw'], fill_state, 'Province')
+    # filter out unneccessary rows [such as Notes & repeated columns names]
+    # in a single pass, based on the rules of the layout (see lmia_filters.py)
+    df_name = filter_rows(df_name, '2017_q1_to_2021_q3')
+    # rename the column properly at the end by removing the 'raw' part
+    df_name = df_name.rename(columns={"Province_raw": "Province",
+                                                "Stream_raw":"Stream",
+                                                "Employer_raw": "Employer", 
+                                                "Address_raw": "Address",
+                                                "NOC_raw":"NOC",
+                                                "Positions_raw": "Positions"})
+    # add a few missing columns for future
+    df_name['Incorporate_status'] = np.nan
+    df_name['LMIAs'] = np.nan
+    return(df_name)
+
+
+###############################################################################
+# Period 4: 2021-Q4 - 2024Q1
+# Build a function that will process the dataset.
+
+def process_2021_q4_to_2024_q1(df_raw, fill_state=None):
+    # Work on a copy of the raw DataFrame
+    df_name = df_raw.copy()
+    # Add proper raw names for the columns
+    df_name.columns = ['Province_raw', 'Stream_raw', 'Employer_raw', 'Address_raw', 'NOC_raw', 'Incorporate_status_raw', 'LMIAs_raw','Positions_raw']
+    # filter out unneccessary rows [such as Notes & repeated columns names]
+    # in a single pass, based on the rules of the layout (see lmia_filters.py)
+    df_name = filter_rows(df_name, '2021_q4_to_2024_q1')
+    # rename the column properly at the end by removin the 'raw' part
+    df_name = df_name.rename(columns={"Province_raw": "Province",
+                                                "Stream_raw":"Stream",
+                                                "Employer_raw": "Employer", 
+                                                "Address_raw": "Address",
+                                                "NOC_raw":"NOC",
+                                                "Incorporate_status_raw":"Incorporate_status",
+                                                "LMIAs_raw":"LMIAs",
+                                                "Positions_raw": "Positions"})
+    return(df_name)
+
+
+###############################################################################
+# Final touch - split NOC column in 2: NOC code and NOC label
+# The NOC 2011 codes have 4 digits ("6322-Cooks"), the NOC 2021 codes have
+# 5 digits ("63200-Cooks")
+
+NOC_PATTERN = r'^[ \t]*([0-9]{4,5})(?:[ \t]*-[ \t]*|[ \t]+|$)(.*)$'
+
+
+def parse_noc(noc):
+    # NOC code and label of NOC values. A value without a code is kept as the label
+    noc = noc.astype(object)
+    parts = noc.str.extract(NOC_PATTERN)
+    return parts[0], parts[1].where(parts[0].notna(), noc)
+
+
+def split_noc(df_name):
+    # the NOC column is empty (float) for the 2014 & 2015 files
+    df_name['NOC_code'], df_name['NOC_label'] = parse_noc(df_name['NOC'])
+    return(df_name)